@@ -0,0 +1,327 @@
+import asyncio
+import json
+import threading
+import time
+import numpy as np
+from app.lexical import BM25Index
+from app.config import (
+    get_async_supabase,
+    HOT_KB_USER_IDS,
+    MIRROR_INDEX_TYPE,
+    MIRROR_SYNC_INTERVAL_S,
+    MIRROR_MAX_STALENESS_S,
+    EMBEDDING_MODEL,
+)
+
+# Rows per PostgREST page when loading (each row carries a full embedding)
+LOAD_PAGE_SIZE = 500
+ID_PAGE_SIZE = 1000
+# Ids per `in.(...)` row lookup, well under URL length limits
+ID_LOOKUP_PAGE_SIZE = 100
+
+
+def _parse_embedding(value):
+    # pgvector columns come back from PostgREST as "[0.1,0.2,...]" strings
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype="float32")
+
+
+class KBMirror:
+    """
+    In-process FAISS copy of one KB (documents rows for a user_id).
+    - "flat": exact inner-product search, deletes remove vectors directly
+    - "hnsw": approximate search; deletes are tombstoned and the graph is
+      rebuilt once tombstones pass 20% of the index
+    Vectors are L2-normalized so scores match match_documents' cosine similarity.
+    The dimension is taken from the first embeddings loaded unless given.
+    """
+
+    def __init__(self, user_id: str, index_type: str = "flat", dim: int = None):
+        self.user_id = user_id
+        self.index_type = index_type
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._ids = {}        # documents.id -> faiss id
+        self._rows = {}       # faiss id -> {"id", "content", "metadata"}
+        self._vectors = {}    # faiss id -> vector (hnsw rebuilds only)
+        self._tombstones = set()
+        self.index = self._new_index() if dim else None
+        # BM25 over the same rows for hybrid retrieval
+        self.lexical = BM25Index()
+        self.last_synced = 0.0
+        self.loaded = False
+        self.searches = 0
+
+    def _new_index(self):
+        import faiss
+        if self.index_type == "hnsw":
+            return faiss.IndexIDMap2(faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT))
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _check_dim(self, dim: int, what: str, expected: int = None):
+        expected = expected or self.dim
+        if dim != expected:
+            raise ValueError(
+                f"KB mirror {self.user_id}: {what} has dimension {dim}, expected {expected} "
+                f"(EMBEDDING_MODEL={EMBEDDING_MODEL}); was the KB embedded with a different model?"
+            )
+
+    def add_rows(self, rows):
+        import faiss
+        new_rows = [r for r in rows if r["id"] not in self._ids]
+        if not new_rows:
+            return 0
+
+        vectors = [_parse_embedding(r["embedding"]) for r in new_rows]
+        expected = self.dim or len(vectors[0])
+        for vector in vectors:
+            self._check_dim(len(vector), "embedding", expected)
+        vectors = np.stack(vectors)
+        faiss.normalize_L2(vectors)
+        with self._lock:
+            if self.index is None:
+                self.dim = vectors.shape[1]
+                self.index = self._new_index()
+            faiss_ids = np.arange(self._next_id, self._next_id + len(new_rows), dtype="int64")
+            self._next_id += len(new_rows)
+            for faiss_id, row, vector in zip(faiss_ids, new_rows, vectors):
+                faiss_id = int(faiss_id)
+                self._ids[row["id"]] = faiss_id
+                self._rows[faiss_id] = {"id": row["id"], "content": row["content"], "metadata": row["metadata"]}
+                if self.index_type == "hnsw":
+                    self._vectors[faiss_id] = vector
+                self.lexical.add(row["id"], row["content"])
+            self.index.add_with_ids(vectors, faiss_ids)
+        return len(new_rows)
+
+    def remove_ids(self, doc_ids):
+        removed = 0
+        with self._lock:
+            faiss_ids = []
+            for doc_id in doc_ids:
+                faiss_id = self._ids.pop(doc_id, None)
+                if faiss_id is None:
+                    continue
+                self._rows.pop(faiss_id, None)
+                self._vectors.pop(faiss_id, None)
+                self.lexical.remove(doc_id)
+                faiss_ids.append(faiss_id)
+            removed = len(faiss_ids)
+            if not faiss_ids:
+                return 0
+
+            if self.index_type == "hnsw":
+                self._tombstones.update(faiss_ids)
+                if len(self._tombstones) > 0.2 * max(self.index.ntotal, 1):
+                    self._rebuild()
+            else:
+                self.index.remove_ids(np.asarray(faiss_ids, dtype="int64"))
+        return removed
+
+    def _rebuild(self):
+        # Caller holds the lock
+        self.index = self._new_index()
+        self._tombstones.clear()
+        if self._vectors:
+            faiss_ids = np.asarray(list(self._vectors.keys()), dtype="int64")
+            self.index.add_with_ids(np.stack(list(self._vectors.values())), faiss_ids)
+
+    def search(self, query_embedding, k: int):
+        """Return rows shaped like match_documents results"""
+        import faiss
+        query = np.asarray([query_embedding], dtype="float32")
+        faiss.normalize_L2(query)
+        with self._lock:
+            if self.index is None:
+                return []
+            self._check_dim(query.shape[1], "query embedding")
+            # Over-fetch past tombstones on hnsw
+            fetch = min(k + len(self._tombstones), self.index.ntotal)
+            if fetch <= 0:
+                return []
+            scores, faiss_ids = self.index.search(query, fetch)
+            results = []
+            for score, faiss_id in zip(scores[0], faiss_ids[0]):
+                row = self._rows.get(int(faiss_id))
+                if faiss_id < 0 or row is None:
+                    continue
+                results.append({**row, "similarity": float(score)})
+                if len(results) == k:
+                    break
+        self.searches += 1
+        return results
+
+    def lexical_search(self, query: str, k: int):
+        """BM25 search over the mirrored rows, shaped like search() results"""
+        results = []
+        for doc_id, score in self.lexical.search(query, k):
+            faiss_id = self._ids.get(doc_id)
+            row = self._rows.get(faiss_id) if faiss_id is not None else None
+            if row is not None:
+                results.append({**row, "bm25": score})
+        return results
+
+    def is_fresh(self) -> bool:
+        return self.loaded and time.monotonic() - self.last_synced < MIRROR_MAX_STALENESS_S
+
+    def stats(self):
+        return {
+            "rows": len(self),
+            "index_type": self.index_type,
+            "dim": self.dim,
+            "fresh": self.is_fresh(),
+            "seconds_since_sync": round(time.monotonic() - self.last_synced, 1) if self.loaded else None,
+            "searches": self.searches,
+        }
+
+
+async def _fetch_rows(user_id: str):
+    """Every row of the KB (initial load)"""
+    client = await get_async_supabase()
+    rows = []
+    offset = 0
+    while True:
+        page = (
+            await client.table("documents")
+            .select("id, content, metadata, embedding")
+            .eq("user_id", user_id)
+            .order("id")
+            .range(offset, offset + LOAD_PAGE_SIZE - 1)
+            .execute()
+        ).data
+        rows.extend(page)
+        if len(page) < LOAD_PAGE_SIZE:
+            return rows
+        offset += LOAD_PAGE_SIZE
+
+
+async def _fetch_rows_by_id(doc_ids):
+    client = await get_async_supabase()
+    doc_ids = list(doc_ids)
+    rows = []
+    for i in range(0, len(doc_ids), ID_LOOKUP_PAGE_SIZE):
+        rows.extend((
+            await client.table("documents")
+            .select("id, content, metadata, embedding")
+            .in_("id", doc_ids[i:i + ID_LOOKUP_PAGE_SIZE])
+            .execute()
+        ).data)
+    return rows
+
+
+async def _fetch_ids(user_id: str):
+    client = await get_async_supabase()
+    ids = set()
+    offset = 0
+    while True:
+        page = (
+            await client.table("documents")
+            .select("id")
+            .eq("user_id", user_id)
+            .order("id")
+            .range(offset, offset + ID_PAGE_SIZE - 1)
+            .execute()
+        ).data
+        ids.update(r["id"] for r in page)
+        if len(page) < ID_PAGE_SIZE:
+            return ids
+        offset += ID_PAGE_SIZE
+
+
+async def sync_mirror(mirror: KBMirror):
+    """
+    Diff the KB's ids against the mirror: fetch rows that are new upstream
+    and drop rows deleted upstream. Ids are used rather than created_at,
+    which ingestion does not set.
+    """
+    if not mirror.loaded:
+        added = await asyncio.to_thread(mirror.add_rows, await _fetch_rows(mirror.user_id))
+        removed = 0
+    else:
+        upstream_ids = await _fetch_ids(mirror.user_id)
+        mirror_ids = set(mirror._ids)
+        new_ids = upstream_ids - mirror_ids
+        added = await asyncio.to_thread(mirror.add_rows, await _fetch_rows_by_id(new_ids)) if new_ids else 0
+        removed = mirror.remove_ids(mirror_ids - upstream_ids)
+
+    mirror.loaded = True
+    mirror.last_synced = time.monotonic()
+    if added or removed:
+        print(f"KB mirror {mirror.user_id}: +{added} -{removed} ({len(mirror)} rows)")
+
+
+# '''
+# Registry of hot-KB mirrors, loaded by the FastAPI lifespan
+# '''
+_mirrors = {}
+_sync_task = None
+
+
+async def _resolve_hot_kb_ids():
+    ids = []
+    for entry in HOT_KB_USER_IDS:
+        if entry == "admin":
+            from app.tools import aget_admin_user_id
+            entry = await aget_admin_user_id()
+        ids.append(entry)
+    return ids
+
+
+async def _sync_loop():
+    while True:
+        await asyncio.sleep(MIRROR_SYNC_INTERVAL_S)
+        for mirror in list(_mirrors.values()):
+            try:
+                await sync_mirror(mirror)
+            except Exception as e:
+                # Mirror goes stale and queries fall back to the RPC
+                print(f"KB mirror {mirror.user_id} sync failed: {e}")
+
+
+async def start_mirrors():
+    global _sync_task
+    if not HOT_KB_USER_IDS:
+        return
+
+    for user_id in await _resolve_hot_kb_ids():
+        mirror = KBMirror(user_id, index_type=MIRROR_INDEX_TYPE)
+        started = time.perf_counter()
+        try:
+            await sync_mirror(mirror)
+        except Exception as e:
+            print(f"KB mirror {user_id} initial load failed: {e}")
+        _mirrors[user_id] = mirror
+        print(f"KB mirror {user_id} loaded {len(mirror)} rows in {time.perf_counter() - started:.1f}s")
+
+    _sync_task = asyncio.create_task(_sync_loop())
+
+
+async def stop_mirrors():
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        _sync_task = None
+    _mirrors.clear()
+
+
+def get_fresh_mirror(user_id: str):
+    """Mirror for this KB if one exists and is recent enough to answer queries"""
+    mirror = _mirrors.get(user_id)
+    if mirror is not None and mirror.is_fresh():
+        return mirror
+    return None
+
+
+def remove_from_mirrors(user_id: str, doc_ids):
+    mirror = _mirrors.get(user_id)
+    if mirror is not None:
+        mirror.remove_ids(doc_ids)
+
+
+def mirror_stats():
+    return {user_id: m.stats() for user_id, m in _mirrors.items()}
@@ -0,0 +1,224 @@
+"""
+Retention and compaction for LangGraph's Postgres checkpoint tables.
+
+The checkpointer writes a checkpoint (plus its channel blobs and pending
+writes) for every super-step, but only the latest state of a thread is ever
+read. Compaction, in one transaction:
+- drops threads whose newest checkpoint is older than the retention window,
+- keeps only the newest `keep_last` checkpoints of every other idle thread,
+- deletes writes whose checkpoint is gone and blobs no remaining checkpoint
+  references (checkpoint->'channel_versions').
+
+Threads that had a checkpoint in the last `idle_seconds` are left alone, so a
+run in progress never loses the blobs it is about to reference.
+"""
+import asyncio
+from app.config import (
+    SUPABASE_DB_URI,
+    CHECKPOINT_KEEP_LAST,
+    CHECKPOINT_RETENTION_DAYS,
+    CHECKPOINT_COMPACT_IDLE_S,
+    CHECKPOINT_COMPACT_INTERVAL_S,
+)
+
+CHECKPOINT_TABLES = ("checkpoints", "checkpoint_blobs", "checkpoint_writes")
+
+_THREADS_SQL = """
+CREATE TEMP TABLE compact_threads ON COMMIT DROP AS
+SELECT thread_id,
+       max((checkpoint->>'ts')::timestamptz) AS last_ts
+FROM checkpoints
+GROUP BY thread_id
+"""
+
+_EXPIRED = "thread_id IN (SELECT thread_id FROM compact_threads WHERE last_ts < now() - make_interval(days => %(retention_days)s))"
+_IDLE = "thread_id IN (SELECT thread_id FROM compact_threads WHERE last_ts < now() - make_interval(secs => %(idle_seconds)s))"
+
+# Every statement returns (rows, bytes) of what it deleted
+_EXPIRED_SQL = """
+WITH d AS (DELETE FROM {table} t WHERE """ + _EXPIRED + """ RETURNING pg_column_size(t.*) AS bytes)
+SELECT count(*), coalesce(sum(bytes), 0) FROM d
+"""
+
+_OLD_CHECKPOINTS_SQL = """
+WITH ranked AS (
+    SELECT thread_id, checkpoint_ns, checkpoint_id,
+           row_number() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+    FROM checkpoints
+    WHERE """ + _IDLE + """
+),
+d AS (
+    DELETE FROM checkpoints c
+    USING ranked r
+    WHERE c.thread_id = r.thread_id AND c.checkpoint_ns = r.checkpoint_ns
+      AND c.checkpoint_id = r.checkpoint_id AND r.rn > %(keep_last)s
+    RETURNING pg_column_size(c.*) AS bytes
+)
+SELECT count(*), coalesce(sum(bytes), 0) FROM d
+"""
+
+_ORPHAN_WRITES_SQL = """
+WITH d AS (
+    DELETE FROM checkpoint_writes w
+    WHERE w.""" + _IDLE + """
+      AND NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns
+          AND c.checkpoint_id = w.checkpoint_id
+      )
+    RETURNING pg_column_size(w.*) AS bytes
+)
+SELECT count(*), coalesce(sum(bytes), 0) FROM d
+"""
+
+_ORPHAN_BLOBS_SQL = """
+WITH d AS (
+    DELETE FROM checkpoint_blobs b
+    WHERE b.""" + _IDLE + """
+      AND NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+          AND c.checkpoint->'channel_versions'->>b.channel = b.version
+      )
+    RETURNING pg_column_size(b.*) AS bytes
+)
+SELECT count(*), coalesce(sum(bytes), 0) FROM d
+"""
+
+_TABLE_SIZE_SQL = "SELECT pg_total_relation_size(%s::regclass)"
+
+
+def _add(report: dict, table: str, row):
+    report["tables"][table]["rows"] += row[0]
+    report["tables"][table]["bytes"] += int(row[1])
+
+
+def compact_checkpoint_rows(conn, keep_last: int, retention_days: int, idle_seconds: int, dry_run: bool = False):
+    """
+    Run the compaction statements in one transaction (rolled back with dry_run).
+    Returns {"expired_thread_ids", "tables": {table: {"rows", "bytes"}}}; bytes
+    are the on-disk size of the deleted rows.
+    """
+    params = {"keep_last": keep_last, "retention_days": retention_days, "idle_seconds": idle_seconds}
+    report = {"expired_thread_ids": [], "tables": {t: {"rows": 0, "bytes": 0} for t in CHECKPOINT_TABLES}}
+
+    with conn.transaction(force_rollback=dry_run):
+        with conn.cursor() as cur:
+            cur.execute(_THREADS_SQL)
+
+            if retention_days:
+                cur.execute(
+                    "SELECT thread_id FROM compact_threads WHERE last_ts < now() - make_interval(days => %(retention_days)s)",
+                    params,
+                )
+                report["expired_thread_ids"] = [row[0] for row in cur.fetchall()]
+                for table in CHECKPOINT_TABLES:
+                    cur.execute(_EXPIRED_SQL.format(table=table), params)
+                    _add(report, table, cur.fetchone())
+
+            if keep_last:
+                cur.execute(_OLD_CHECKPOINTS_SQL, params)
+                _add(report, "checkpoints", cur.fetchone())
+
+            cur.execute(_ORPHAN_WRITES_SQL, params)
+            _add(report, "checkpoint_writes", cur.fetchone())
+            cur.execute(_ORPHAN_BLOBS_SQL, params)
+            _add(report, "checkpoint_blobs", cur.fetchone())
+    return report
+
+
+def table_sizes(conn) -> dict:
+    with conn.cursor() as cur:
+        sizes = {}
+        for table in CHECKPOINT_TABLES:
+            cur.execute(_TABLE_SIZE_SQL, (table,))
+            sizes[table] = cur.fetchone()[0]
+    return sizes
+
+
+def print_report(report: dict):
+    for table, counts in report["tables"].items():
+        print(f"  {table:<18} {counts['rows']:>9} rows  {counts['bytes'] / 1024 / 1024:>9.1f} MB")
+    print(f"  {len(report['expired_thread_ids'])} threads past retention, "
+          f"{report['rows_deleted']} rows / {report['bytes_deleted'] / 1024 / 1024:.1f} MB deleted")
+    if "size_before" in report:
+        print(f"  table size {report['size_before'] / 1024 / 1024:.1f} MB -> "
+              f"{report['size_after'] / 1024 / 1024:.1f} MB")
+
+
+def compact_checkpoints(
+    keep_last: int = CHECKPOINT_KEEP_LAST,
+    retention_days: int = CHECKPOINT_RETENTION_DAYS,
+    idle_seconds: int = CHECKPOINT_COMPACT_IDLE_S,
+    vacuum: bool = False,
+    dry_run: bool = False,
+):
+    """
+    Compact the checkpoint tables. With vacuum, VACUUM (ANALYZE) them afterwards
+    and report table sizes before/after (plain DELETE only frees space for reuse).
+    """
+    import psycopg
+
+    if not SUPABASE_DB_URI:
+        raise ValueError("SUPABASE_DB_URI is not set")
+
+    with psycopg.connect(SUPABASE_DB_URI, prepare_threshold=0) as conn:
+        size_before = sum(table_sizes(conn).values())
+        conn.commit()
+        report = compact_checkpoint_rows(conn, keep_last, retention_days, idle_seconds, dry_run=dry_run)
+
+        if vacuum and not dry_run:
+            conn.autocommit = True
+            for table in CHECKPOINT_TABLES:
+                conn.execute(f"VACUUM (ANALYZE) {table}")
+        size_after = sum(table_sizes(conn).values())
+
+    report["dry_run"] = dry_run
+    report["rows_deleted"] = sum(t["rows"] for t in report["tables"].values())
+    report["bytes_deleted"] = sum(t["bytes"] for t in report["tables"].values())
+    report["size_before"] = size_before
+    report["size_after"] = size_after
+    return report
+
+
+# '''
+# Optional periodic compaction inside the API process
+# (CHECKPOINT_COMPACT_INTERVAL_S > 0)
+# '''
+_compact_task = None
+_last_report = None
+
+
+async def _compact_loop(on_expired=None):
+    global _last_report
+    while True:
+        await asyncio.sleep(CHECKPOINT_COMPACT_INTERVAL_S)
+        try:
+            report = await asyncio.to_thread(compact_checkpoints)
+        except Exception as e:
+            print(f"Checkpoint compaction failed: {e}")
+            continue
+        if on_expired and report["expired_thread_ids"]:
+            on_expired(report["expired_thread_ids"])
+        print(f"Checkpoint compaction: {report['rows_deleted']} rows, "
+              f"{report['bytes_deleted'] / 1024 / 1024:.1f} MB deleted")
+        _last_report = {k: v for k, v in report.items() if k != "expired_thread_ids"}
+
+
+def start_checkpoint_compaction(on_expired=None):
+    """Schedule compaction; on_expired(thread_ids) is called for threads dropped by retention"""
+    global _compact_task
+    if CHECKPOINT_COMPACT_INTERVAL_S <= 0 or _compact_task is not None:
+        return
+    _compact_task = asyncio.create_task(_compact_loop(on_expired))
+
+
+async def stop_checkpoint_compaction():
+    global _compact_task
+    if _compact_task is not None:
+        _compact_task.cancel()
+        _compact_task = None
+
+
+def compaction_stats():
+    return {"interval_s": CHECKPOINT_COMPACT_INTERVAL_S, "last_run": _last_report}
@@ -0,0 +1,95 @@
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from app.config import (
+    SUPABASE_DB_URI,
+    CHECKPOINT_POOL_MIN_SIZE,
+    CHECKPOINT_POOL_MAX_SIZE,
+    CHECKPOINT_POOL_TIMEOUT,
+    CHECKPOINT_POOL_MAX_IDLE,
+)
+
+# Process-wide pool and checkpointer, created once by the FastAPI lifespan
+_pool = None
+_checkpointer = None
+
+
+async def open_checkpointer():
+    """
+    Open the shared connection pool and run checkpointer migrations once.
+    Safe to call more than once; later calls return the existing checkpointer.
+    """
+    global _pool, _checkpointer
+    if _checkpointer is not None:
+        return _checkpointer
+
+    _pool = AsyncConnectionPool(
+        conninfo=SUPABASE_DB_URI,
+        min_size=CHECKPOINT_POOL_MIN_SIZE,
+        max_size=CHECKPOINT_POOL_MAX_SIZE,
+        timeout=CHECKPOINT_POOL_TIMEOUT,
+        max_idle=CHECKPOINT_POOL_MAX_IDLE,
+        # Health check run on every checkout; broken connections are replaced
+        check=AsyncConnectionPool.check_connection,
+        # Settings required by AsyncPostgresSaver (and pgbouncer-style poolers)
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        open=False,
+    )
+    await _pool.open(wait=True)
+
+    _checkpointer = AsyncPostgresSaver(_pool)
+    await _checkpointer.setup()
+    print(f"Checkpointer pool ready (min={CHECKPOINT_POOL_MIN_SIZE}, max={CHECKPOINT_POOL_MAX_SIZE})")
+    return _checkpointer
+
+
+def get_checkpointer():
+    if _checkpointer is None:
+        raise RuntimeError("Checkpointer is not initialised; call open_checkpointer() at startup")
+    return _checkpointer
+
+
+async def close_checkpointer():
+    global _pool, _checkpointer
+    if _pool is not None:
+        await _pool.close()
+    _pool = None
+    _checkpointer = None
+
+
+async def latest_checkpoint_id(thread_id: str, checkpoint_ns: str = ""):
+    """Id of the thread's newest checkpoint, read without loading its blobs"""
+    async with _pool.connection() as conn:
+        cur = await conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = %s AND checkpoint_ns = %s "
+            "ORDER BY checkpoint_id DESC LIMIT 1",
+            (thread_id, checkpoint_ns),
+        )
+        row = await cur.fetchone()
+    return row["checkpoint_id"] if row else None
+
+
+def get_pool_stats():
+    """
+    Return pool counters. `requests_queued` counts checkouts that had to wait
+    because every connection was busy (pool exhaustion), `requests_errors`
+    counts checkouts that timed out waiting.
+    """
+    if _pool is None:
+        return {"status": "closed"}
+
+    stats = _pool.get_stats()
+    return {
+        "status": "open",
+        "pool_min": stats.get("pool_min"),
+        "pool_max": stats.get("pool_max"),
+        "pool_size": stats.get("pool_size", 0),
+        "pool_available": stats.get("pool_available", 0),
+        "requests_waiting": stats.get("requests_waiting", 0),
+        "requests_num": stats.get("requests_num", 0),
+        "pool_exhausted": stats.get("requests_queued", 0),
+        "pool_timeouts": stats.get("requests_errors", 0),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+        "returns_bad": stats.get("returns_bad", 0),
+    }
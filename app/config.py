@@ -1,7 +1,6 @@
 import os
-from supabase import create_client
-from sentence_transformers import CrossEncoder
-from langchain_openai import OpenAIEmbeddings
+import asyncio
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,16 +8,177 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_API_KEY")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_API_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY")
+# Heavy clients are built on first use (or by the lifespan warm-up), not at
+# import time, so scripts that only need settings start fast.
+_supabase = None
+_supabase_lock = threading.Lock()
+
+def _check_supabase_env():
+    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+        raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY")
+
+def get_supabase():
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                _check_supabase_env()
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _supabase
+
+# Async client used on the /query path; created on first use inside the event loop
+_async_supabase = None
+_async_supabase_lock = asyncio.Lock()
+
+async def get_async_supabase():
+    global _async_supabase
+    if _async_supabase is None:
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _check_supabase_env()
+                from supabase import acreate_client
+                _async_supabase = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _async_supabase
 
-supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 SUPABASE_DB_URI = os.getenv("SUPABASE_DB_URI")
 
-cross_encoder = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-embeddings = OpenAIEmbeddings()
+# Connection pool backing the LangGraph Postgres checkpointer
+CHECKPOINT_POOL_MIN_SIZE = int(os.getenv("CHECKPOINT_POOL_MIN_SIZE", "1"))
+CHECKPOINT_POOL_MAX_SIZE = int(os.getenv("CHECKPOINT_POOL_MAX_SIZE", "10"))
+CHECKPOINT_POOL_TIMEOUT = float(os.getenv("CHECKPOINT_POOL_TIMEOUT", "30"))
+CHECKPOINT_POOL_MAX_IDLE = float(os.getenv("CHECKPOINT_POOL_MAX_IDLE", "300"))
+
+# Checkpoint retention (python compact_checkpoints.py, or every
+# CHECKPOINT_COMPACT_INTERVAL_S in the API process; 0 = not scheduled):
+# checkpoints kept per thread, days before an idle thread is dropped
+# (0 = never) and how long a thread must be idle before it is compacted
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "1"))
+CHECKPOINT_RETENTION_DAYS = int(os.getenv("CHECKPOINT_RETENTION_DAYS", "0"))
+CHECKPOINT_COMPACT_IDLE_S = int(os.getenv("CHECKPOINT_COMPACT_IDLE_S", "600"))
+CHECKPOINT_COMPACT_INTERVAL_S = int(os.getenv("CHECKPOINT_COMPACT_INTERVAL_S", "0"))
+
+# Threads whose formatted conversation history is cached per process
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "1000"))
+
+# Agent history policy: token budget for the history sent per model call,
+# turns whose tool output is sent in full, turns never folded into the rolling
+# summary, and the size of older history that triggers a summary (0 = off)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000"))
+CONTEXT_FULL_TOOL_TURNS = int(os.getenv("CONTEXT_FULL_TOOL_TURNS", "1"))
+CONTEXT_KEEP_RECENT_TURNS = int(os.getenv("CONTEXT_KEEP_RECENT_TURNS", "4"))
+CONTEXT_SUMMARY_TRIGGER_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TRIGGER_TOKENS", "4000"))
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+
+# Max compiled LangGraph workflows kept per process
+GRAPH_CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", "64"))
+
+# Threads available for CPU-bound cross-encoder scoring off the event loop
+RERANK_MAX_WORKERS = int(os.getenv("RERANK_MAX_WORKERS", "2"))
+
+# Document ingestion: embedding batches, parallel embedding calls,
+# rows per PostgREST insert and where ingestion state (PDF sync manifests) is kept
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+INSERT_PAGE_SIZE = int(os.getenv("INSERT_PAGE_SIZE", "200"))
+INGEST_STATE_DIR = os.getenv("INGEST_STATE_DIR", ".ingest_state")
+
+# Query-embedding cache: in-memory LRU entries, optional SQLite file
+# (empty path disables the persistent tier) and its size limit
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "")
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Two-stage retrieval: over-fetch RETRIEVAL_CANDIDATE_K chunks by vector similarity,
+# rerank them and keep RETRIEVAL_FINAL_K. When observed rerank latency says the
+# candidates would not fit in RERANK_LATENCY_BUDGET_MS the depth is shrunk
+# (never below the final k). Budget 0 disables the adjustment.
+RETRIEVAL_CANDIDATE_K = int(os.getenv("RETRIEVAL_CANDIDATE_K", "30"))
+RETRIEVAL_FINAL_K = int(os.getenv("RETRIEVAL_FINAL_K", "3"))
+RERANK_LATENCY_BUDGET_MS = float(os.getenv("RERANK_LATENCY_BUDGET_MS", "150"))
+
+# Background jobs (uploads, purges): process-pool workers, how many jobs one
+# user may have running at once, and how many finished jobs stay queryable
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "local")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "1"))
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "1000"))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "") or None
+# Storage objects removed per request when purging a user
+PURGE_STORAGE_BATCH_SIZE = int(os.getenv("PURGE_STORAGE_BATCH_SIZE", "100"))
 
-PDF_DIR = "/home/hp/Desktop/Workplace/CustomizeGPT/data"
+# Per-user lookups made before every query (active prompt, admin id, has-documents)
+# are cached for LOOKUP_CACHE_TTL seconds (admin id for ADMIN_ID_CACHE_TTL) and
+# invalidated on writes. LOOKUP_CACHE_REDIS_URL shares them across workers.
+LOOKUP_CACHE_SIZE = int(os.getenv("LOOKUP_CACHE_SIZE", "4096"))
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "60"))
+ADMIN_ID_CACHE_TTL = float(os.getenv("ADMIN_ID_CACHE_TTL", "600"))
+LOOKUP_CACHE_REDIS_URL = os.getenv("LOOKUP_CACHE_REDIS_URL", "")
+
+# Hybrid retrieval: BM25 / Postgres full-text candidates are fused with vector
+# candidates by reciprocal rank fusion before reranking
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+LEXICAL_CANDIDATE_K = int(os.getenv("LEXICAL_CANDIDATE_K", "30"))
+LEXICAL_FETCH_FACTOR = int(os.getenv("LEXICAL_FETCH_FACTOR", "3"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# In-process vector mirrors for hot KBs: comma-separated user ids whose chunks are
+# kept in a local FAISS index ("admin" = the default KB). Queries fall back to the
+# match_documents RPC when a mirror hasn't synced within MIRROR_MAX_STALENESS_S.
+HOT_KB_USER_IDS = [u.strip() for u in os.getenv("HOT_KB_USER_IDS", "").split(",") if u.strip()]
+MIRROR_INDEX_TYPE = os.getenv("MIRROR_INDEX_TYPE", "flat")  # flat | hnsw
+MIRROR_SYNC_INTERVAL_S = float(os.getenv("MIRROR_SYNC_INTERVAL_S", "30"))
+MIRROR_MAX_STALENESS_S = float(os.getenv("MIRROR_MAX_STALENESS_S", "120"))
+
+# Cross-encoder reranking. With RERANK_SERVER_ADDRESS set ("unix:/path.sock"
+# or "host:port") workers score through the shared rerank server
+# (python -m app.rerank_server) and only load the model locally as a fallback.
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_SERVER_ADDRESS = os.getenv("RERANK_SERVER_ADDRESS", "")
+RERANK_SERVER_MAX_BATCH_SIZE = int(os.getenv("RERANK_SERVER_MAX_BATCH_SIZE", "64"))
+RERANK_SERVER_MAX_WAIT_MS = float(os.getenv("RERANK_SERVER_MAX_WAIT_MS", "5"))
+RERANK_CLIENT_TIMEOUT = float(os.getenv("RERANK_CLIENT_TIMEOUT", "2"))
+
+# Cross-encoder score cache keyed by (normalized query, chunk)
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", "3600"))
+
+# Reranker backend: "torch" (sentence-transformers default) or "onnx" (ONNX Runtime, CPU).
+# RERANKER_QUANTIZATION ("avx2", "avx512", "avx512_vnni", "arm64") exports an int8
+# dynamically quantized ONNX model into RERANKER_ONNX_DIR on first load.
+# RERANKER_MAX_LENGTH defaults to the model's 512 tokens; lowering it is faster
+# but truncates long chunks and so changes rankings.
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "torch")
+RERANKER_QUANTIZATION = os.getenv("RERANKER_QUANTIZATION", "")
+RERANKER_ONNX_DIR = os.getenv("RERANKER_ONNX_DIR", ".cache/reranker-onnx")
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "512"))
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+
+# OpenAI embedding model for chunks and queries (langchain_openai's default)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+
+# Load the cross-encoder in the lifespan warm-up instead of on the first query.
+# Skipped when RERANK_SERVER_ADDRESS is set (the server owns the model).
+WARMUP_RERANKER = os.getenv("WARMUP_RERANKER", "true").lower() in ("1", "true", "yes")
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                from langchain_openai import OpenAIEmbeddings
+                _embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    return _embeddings
+
+PDF_DIR = os.getenv("PDF_DIR", "/home/hp/Desktop/Workplace/CustomizeGPT/data")
+
+# Parallel PDF directory loading: worker processes and per-file parse timeout
+PDF_LOAD_WORKERS = int(os.getenv("PDF_LOAD_WORKERS") or os.cpu_count() or 2)
+PDF_LOAD_TIMEOUT_S = float(os.getenv("PDF_LOAD_TIMEOUT_S", "120"))
 
 WEB_URLS = [
     "https://strategisthub.com/services/",
@@ -27,23 +187,30 @@ WEB_URLS = [
     "https://strategisthub.com/blogs/",
 ]
 
+# Website refresh: connection pool size, concurrent requests per host, request
+# timeout, and where ETag / Last-Modified validators are cached
+WEB_CRAWL_MAX_CONNECTIONS = int(os.getenv("WEB_CRAWL_MAX_CONNECTIONS", "10"))
+WEB_CRAWL_PER_HOST = int(os.getenv("WEB_CRAWL_PER_HOST", "2"))
+WEB_CRAWL_TIMEOUT_S = float(os.getenv("WEB_CRAWL_TIMEOUT_S", "20"))
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", ".cache/web_cache.json")
+
 WEAVIATE_URL = os.getenv("WEAVIATE_URL")
 WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY")
 
-from langchain_core.messages import HumanMessage, AIMessage
 MEMORY_TABLE = "user_memories"  # make sure this table exists in Supabase
 
 def save_memory(user_id: str, text: str):
-    supabase.table(MEMORY_TABLE).insert({
+    get_supabase().table(MEMORY_TABLE).insert({
         "user_id": user_id,
         "memory_text": text
     }).execute()
 
 def load_memories(user_id: str):
-    result = supabase.table(MEMORY_TABLE).select("*").eq("user_id", user_id).execute()
+    result = get_supabase().table(MEMORY_TABLE).select("*").eq("user_id", user_id).execute()
     return [r["memory_text"] for r in result.data]
 
 def to_lc_messages(raw_messages):
+    from langchain_core.messages import HumanMessage, AIMessage
 
     print("Converting into langchain format...")
     converted = []
@@ -0,0 +1,223 @@
+"""
+History policy for the agent node.
+
+The checkpointed thread keeps every message, but the model only sees:
+- a rolling summary of turns that were folded away (kept in graph state),
+- the remaining turns, with ToolMessages older than CONTEXT_FULL_TOOL_TURNS
+  turns replaced by a one-line stub,
+- trimmed oldest-turn-first to CONTEXT_TOKEN_BUDGET.
+
+A "turn" starts at a HumanMessage, so an AI tool call is never separated
+from its ToolMessages.
+"""
+import json
+import threading
+from langchain_core.messages import HumanMessage, ToolMessage
+from app.config import (
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_FULL_TOOL_TURNS,
+    CONTEXT_KEEP_RECENT_TURNS,
+    CONTEXT_SUMMARY_TRIGGER_TOKENS,
+)
+
+# Per-message framing overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+# Rough characters per token when the tiktoken encoding is unavailable
+FALLBACK_CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Extend the existing summary with the new messages. Keep facts, names, numbers, "
+    "decisions and open questions; drop pleasantries. Answer with the summary only."
+)
+
+_encoding = None          # False once loading has failed
+_encoding_lock = threading.Lock()
+
+
+def get_token_encoding():
+    """
+    tiktoken's cl100k_base encoding, or None if it cannot be loaded (tiktoken
+    downloads it on first use). Loaded once by the lifespan warm-up; a failure
+    is not retried, token counts fall back to a character estimate.
+    """
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    print(f"Token encoding unavailable ({e.__class__.__name__}: {e}), estimating token counts")
+                    _encoding = False
+    return _encoding or None
+
+
+def count_text_tokens(text: str) -> int:
+    encoding = get_token_encoding()
+    if encoding is None:
+        return len(text) // FALLBACK_CHARS_PER_TOKEN
+    return len(encoding.encode(text))
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    # Multimodal content blocks
+    return " ".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content or [])
+
+
+def count_message_tokens(msg) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_text_tokens(_text(msg.content))
+    for call in getattr(msg, "tool_calls", None) or []:
+        tokens += count_text_tokens(call["name"] + json.dumps(call.get("args", {})))
+    return tokens
+
+
+def count_tokens(messages) -> int:
+    return sum(count_message_tokens(m) for m in messages)
+
+
+def turn_starts(messages):
+    """Indexes of the HumanMessages that open each turn"""
+    return [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+
+
+def stub_tool_message(msg: ToolMessage) -> ToolMessage:
+    sources = []
+    for item in msg.artifact or []:
+        source = item.get("metadata", {}).get("source")
+        if source and source not in sources:
+            sources.append(source)
+    stub = f"[Earlier retrieval result omitted: {len(msg.artifact or [])} chunks"
+    stub += f" from {', '.join(sources)}]" if sources else "]"
+    return msg.model_copy(update={"content": stub})
+
+
+def stub_old_tool_messages(messages, full_tool_turns: int = CONTEXT_FULL_TOOL_TURNS):
+    """Replace ToolMessages outside the last full_tool_turns turns with stubs; returns (messages, stubbed)"""
+    starts = turn_starts(messages)
+    if not full_tool_turns:
+        keep_from = len(messages)
+    elif len(starts) >= full_tool_turns:
+        keep_from = starts[-full_tool_turns]
+    else:
+        keep_from = 0
+
+    out, stubbed = [], 0
+    for i, msg in enumerate(messages):
+        if i < keep_from and isinstance(msg, ToolMessage):
+            out.append(stub_tool_message(msg))
+            stubbed += 1
+        else:
+            out.append(msg)
+    return out, stubbed
+
+
+def trim_to_budget(messages, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Drop whole turns, oldest first, until the messages fit the budget.
+    The latest turn is always kept. Returns (messages, tokens, dropped).
+    """
+    sizes = [count_message_tokens(m) for m in messages]
+    total = sum(sizes)
+    starts = turn_starts(messages)
+    start = 0
+    for next_start in starts[1:]:
+        if total <= budget:
+            break
+        total -= sum(sizes[start:next_start])
+        start = next_start
+    return messages[start:], total, start
+
+
+def summary_cut(messages, summarized_count: int = 0):
+    """
+    Index up to which messages should be folded into the summary, or None
+    when the unsummarized turns before the recent ones are under the trigger.
+    """
+    if not CONTEXT_SUMMARY_TRIGGER_TOKENS:
+        return None
+    starts = [i for i in turn_starts(messages) if i >= summarized_count]
+    if len(starts) <= CONTEXT_KEEP_RECENT_TURNS:
+        return None
+    cut = starts[-CONTEXT_KEEP_RECENT_TURNS] if CONTEXT_KEEP_RECENT_TURNS else len(messages)
+    older, _ = stub_old_tool_messages(messages[summarized_count:cut], full_tool_turns=0)
+    if count_tokens(older) < CONTEXT_SUMMARY_TRIGGER_TOKENS:
+        return None
+    return cut
+
+
+def summary_request(summary: str, messages):
+    """Prompt for folding messages into the existing summary (tool output is left out)"""
+    lines = []
+    for msg in messages:
+        text = _text(msg.content).strip()
+        if not text or isinstance(msg, ToolMessage):
+            continue
+        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
+        lines.append(f"{role}: {text}")
+    return (
+        f"{SUMMARY_PROMPT}\n\n"
+        f"Existing summary:\n{summary or '(none)'}\n\n"
+        "New messages:\n" + "\n".join(lines)
+    )
+
+
+def build_model_input(messages, summary: str = "", summarized_count: int = 0):
+    """Apply the history policy; returns (messages for the model, stats for this call)"""
+    recent = messages[summarized_count:]
+    recent, stubbed = stub_old_tool_messages(recent)
+    recent, tokens, dropped = trim_to_budget(recent)
+    return recent, {"history_tokens": tokens, "stubbed_tool_messages": stubbed, "dropped_messages": dropped}
+
+
+class ContextStats:
+    """Token counts per model call, for /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.last_prompt_tokens = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.stubbed_tool_messages = 0
+        self.dropped_messages = 0
+        self.summaries = 0
+
+    def record_call(self, prompt_tokens: int, call_stats: dict, usage: dict = None):
+        usage = usage or {}
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+            self.last_prompt_tokens = prompt_tokens
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+            self.stubbed_tool_messages += call_stats["stubbed_tool_messages"]
+            self.dropped_messages += call_stats["dropped_messages"]
+
+    def record_summary(self):
+        with self._lock:
+            self.summaries += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model_calls": self.calls,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "last_prompt_tokens": self.last_prompt_tokens,
+                "reported_input_tokens": self.input_tokens,
+                "reported_output_tokens": self.output_tokens,
+                "stubbed_tool_messages": self.stubbed_tool_messages,
+                "dropped_messages": self.dropped_messages,
+                "summaries": self.summaries,
+                "token_budget": CONTEXT_TOKEN_BUDGET,
+            }
+
+
+context_stats = ContextStats()
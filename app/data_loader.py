@@ -1,5 +1,10 @@
 from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
+import multiprocessing
+import signal
+import threading
+from app.config import PDF_LOAD_WORKERS, PDF_LOAD_TIMEOUT_S
 
 # def read_uploaded_file(file_path: str) -> str:
 #     path = Path(file_path)
@@ -24,6 +29,25 @@ def read_uploaded_file(file_path: str) -> str:
     return "\n".join([doc.page_content for doc in docs])
 
 
+def iter_pdf_pages(file_path: str, source: str = None):
+    """
+    Yield one cleaned Document per PDF page, parsing lazily so only the
+    current page is held in memory. Page metadata (page, page_label,
+    total_pages) is kept for citations; `source` overrides the file path.
+    """
+    path = Path(file_path)
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    for page in PyPDFLoader(str(path)).lazy_load():
+        page.page_content = clean_text(page.page_content)
+        if source is not None:
+            page.metadata["source"] = source
+        page.metadata = clean_metadata(page.metadata)
+        if page.page_content.strip():
+            yield page
+
+
 # def load_pdfs_from_directory(directory_path: str):
 #     docs = []
 #     for pdf_file in Path(directory_path).rglob("*.pdf"):
@@ -34,32 +58,99 @@ def read_uploaded_file(file_path: str) -> str:
 #         except Exception as e:
 #             print(f"Error loading {pdf_file}: {e}")
 #     return docs
-def load_pdfs_from_directory(directory_path: str):
+def clean_value(v):
+    if v is None:
+        return v
+    return str(v).replace("\u0000", "")
+
+
+def load_pdfs_from_directory(directory_path: str, parallel: bool = False,
+                            workers: int = PDF_LOAD_WORKERS, timeout: float = PDF_LOAD_TIMEOUT_S):
+    """
+    Load and clean every PDF under directory_path.
+    With parallel, files are parsed in a process pool (iter_pdf_files_parallel);
+    either way each file gets its own timeout. Per-file failures are collected,
+    not printed: returns (docs, errors) with errors as {"file", "error"}.
+    """
     docs = []
-    print("New ...")
-    def clean_value(v):
-        if v is None:
-            return v
-        return str(v).replace("\u0000", "")
+    errors = []
+
+    if parallel:
+        for path, pages, error in iter_pdf_files_parallel(directory_path, workers=workers, timeout=timeout):
+            if error:
+                errors.append({"file": path, "error": error})
+            else:
+                docs.extend(pages)
+        return docs, errors
 
     for pdf_file in Path(directory_path).rglob("*.pdf"):
         try:
             print("Reading data from:", pdf_file)
-            loader = PyPDFLoader(str(pdf_file))
-            pages = loader.load()
+            docs.extend(load_pdf_pages(str(pdf_file), timeout))
+        except Exception as e:
+            errors.append({"file": str(pdf_file), "error": f"{e.__class__.__name__}: {e}"})
 
-            cleaned_pages = []
-            for p in pages:
-                p.page_content = clean_value(p.page_content)
-                p.metadata = {k: clean_value(v) for k, v in p.metadata.items()}
-                cleaned_pages.append(p)
+    return docs, errors
 
-            docs.extend(cleaned_pages)
 
-        except Exception as e:
-            print(f"Error loading {pdf_file}: {e}")
+def _raise_timeout(signum, frame):
+    raise TimeoutError("PDF parsing timed out")
 
-    return docs
+
+def load_pdf_pages(file_path: str, timeout: float = None):
+    """
+    Parse and clean one PDF (runs in a worker process for parallel loads).
+    With a timeout, parsing is interrupted by SIGALRM so a pathological file
+    fails on its own without tying up the worker.
+    """
+    # SIGALRM handlers can only be installed from the main thread
+    use_alarm = (bool(timeout) and hasattr(signal, "SIGALRM")
+                 and threading.current_thread() is threading.main_thread())
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        pages = PyPDFLoader(file_path).load()
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    for p in pages:
+        p.page_content = clean_value(p.page_content)
+        p.metadata = {k: clean_value(v) for k, v in p.metadata.items()}
+    return pages
+
+
+def iter_pdf_files_parallel(directory_path: str, workers: int = PDF_LOAD_WORKERS,
+                            timeout: float = PDF_LOAD_TIMEOUT_S, files=None):
+    """
+    Parse and clean every PDF under directory_path in a process pool, yielding
+    (path, pages, error) as each file completes (completion order, not path order).
+    Failed or timed-out files yield pages=None and an error message; otherwise
+    error is None. At most 2 * workers files are in flight, so memory stays bounded.
+    `files` overrides the directory walk with an explicit list of paths.
+    """
+    pending_files = list(files) if files is not None else sorted(str(p) for p in Path(directory_path).rglob("*.pdf"))
+    pending_files.reverse()
+    print(f"Loading {len(pending_files)} PDFs with {workers} workers...")
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        in_flight = {}
+        while pending_files or in_flight:
+            while pending_files and len(in_flight) < 2 * workers:
+                path = pending_files.pop()
+                in_flight[pool.submit(load_pdf_pages, path, timeout)] = path
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    pages = future.result()
+                except Exception as e:
+                    yield path, None, f"{e.__class__.__name__}: {e}"
+                    continue
+                yield path, pages, None
 
 
 def load_from_websites(urls):
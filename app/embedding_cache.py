@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from app.cache import LRUCache
+from app.config import (
+    get_embeddings,
+    EMBEDDING_MODEL,
+    EMBED_CACHE_SIZE,
+    EMBED_CACHE_PATH,
+    EMBED_CACHE_MAX_BYTES,
+)
+
+
+def normalize_query(text: str) -> str:
+    """Unicode-normalize, case-fold and collapse whitespace so near-identical queries share a key"""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.casefold().split())
+
+
+def query_cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingStore:
+    """
+    Persistent local tier. Vectors are stored as float32 blobs and the
+    least recently used rows are evicted once the table exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_last_used ON query_embeddings(last_used)")
+        self._conn.commit()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE query_embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return array("f", row[0]).tolist()
+
+    def set(self, key: str, vector):
+        blob = array("f", vector).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM query_embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the limit so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM query_embeddings ORDER BY last_used ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM query_embeddings WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_embeddings"
+            ).fetchone()
+        return {"path": self.path, "entries": count, "bytes": total, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier memoization of query embeddings keyed by (model, normalized text):
+    an in-memory LRU in front of an optional SQLite store.
+    """
+
+    def __init__(self, get_embedder, model: str, memory_size: int, disk_path: str = None, disk_max_bytes: int = 0):
+        # Embedder is resolved on first miss so importing the cache stays cheap
+        self.get_embedder = get_embedder
+        self.model = model
+        self.memory = LRUCache(maxsize=memory_size, name="query_embeddings")
+        self.disk = SQLiteEmbeddingStore(disk_path, disk_max_bytes) if disk_path else None
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def aembed_query(self, text: str):
+        key = query_cache_key(text, self.model)
+
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+
+        if self.disk is not None:
+            vector = await asyncio.to_thread(self.disk.get, key)
+            if vector is not None:
+                self.disk_hits += 1
+                self.memory.set(key, vector)
+                return vector
+
+        self.misses += 1
+        vector = await self.get_embedder().aembed_query(text)
+        self.memory.set(key, vector)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, vector)
+        return vector
+
+    def embed_query(self, text: str):
+        key = query_cache_key(text, self.model)
+
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self.memory.set(key, vector)
+                return vector
+
+        self.misses += 1
+        vector = self.get_embedder().embed_query(text)
+        self.memory.set(key, vector)
+        if self.disk is not None:
+            self.disk.set(key, vector)
+        return vector
+
+    def stats(self):
+        memory_stats = self.memory.stats()
+        lookups = memory_stats["hits"] + self.disk_hits + self.misses
+        return {
+            "model": self.model,
+            "memory": memory_stats,
+            "disk": self.disk.stats() if self.disk is not None else None,
+            "memory_hits": memory_stats["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory_stats["hits"] + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    get_embeddings,
+    EMBEDDING_MODEL,
+    memory_size=EMBED_CACHE_SIZE,
+    disk_path=EMBED_CACHE_PATH or None,
+    disk_max_bytes=EMBED_CACHE_MAX_BYTES,
+)
@@ -1,35 +1,166 @@
 from langgraph.graph import StateGraph, MessagesState
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_openai import ChatOpenAI
 # from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.prebuilt import ToolNode
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, END
+from app.cache import LRUCache
+from app.config import GRAPH_CACHE_SIZE, CONTEXT_SUMMARY_MODEL
+from app.tools import build_retriever_tools
+from app.context_window import (
+    build_model_input,
+    count_tokens,
+    summary_cut,
+    summary_request,
+    context_stats,
+)
+import hashlib
+import threading
 import os
 
+
+class AgentState(MessagesState):
+    # Rolling summary of messages[:summarized_count]; the model sees the
+    # summary plus the messages after it (see app/context_window.py)
+    summary: str
+    summarized_count: int
+
+
 def build_workflow(tools, system_prompt, checkpointer, modal_name: str):
     model = ChatOpenAI(model=modal_name, temperature=0).bind_tools(tools)
     print(f"Using model: {modal_name}")
     # api_key = os.getenv("GOOGLE_API_KEY")
     # model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0, google_api_key = api_key).bind_tools(tools)
 
+    summarizer = ChatOpenAI(model=CONTEXT_SUMMARY_MODEL, temperature=0)
+
     tool_node = ToolNode(tools)
 
-    def call_model(state: MessagesState):
-        response = model.invoke([SystemMessage(content=system_prompt)] + state["messages"])
+    async def call_model(state: AgentState):
+        summary = state.get("summary", "")
+        history, call_stats = build_model_input(state["messages"], summary, state.get("summarized_count", 0))
+        system_content = system_prompt
+        if summary:
+            system_content += f"\n\nSummary of the earlier conversation:\n{summary}"
+        messages = [SystemMessage(content=system_content)] + history
+
+        prompt_tokens = count_tokens(messages)
+        response = await model.ainvoke(messages)
+        context_stats.record_call(prompt_tokens, call_stats, getattr(response, "usage_metadata", None))
+        print(f"Model call: ~{prompt_tokens} prompt tokens, {len(history)} messages, "
+              f"{call_stats['stubbed_tool_messages']} tool outputs stubbed, "
+              f"{call_stats['dropped_messages']} messages dropped")
         return {"messages": [response]}
 
-    def should_continue(state: MessagesState):
+    async def summarize_history(state: AgentState):
+        start = state.get("summarized_count", 0)
+        cut = summary_cut(state["messages"], start)
+        if cut is None:
+            return {}
+        request = summary_request(state.get("summary", ""), state["messages"][start:cut])
+        response = await summarizer.ainvoke([HumanMessage(content=request)])
+        context_stats.record_summary()
+        print(f"Summarized messages {start}-{cut} of thread history")
+        return {"summary": response.content, "summarized_count": cut}
+
+    def route_start(state: AgentState):
+        # Only checked when a new user message arrives, never between tool calls
+        if summary_cut(state["messages"], state.get("summarized_count", 0)) is not None:
+            return "summarize"
+        return "agent"
+
+    def should_continue(state: AgentState):
         last_message = state["messages"][-1]
         if last_message.tool_calls:
             return "tools"
         return END
 
-    workflow = StateGraph(MessagesState)
+    workflow = StateGraph(AgentState)
+    workflow.add_node("summarize", summarize_history)
     workflow.add_node("agent", call_model)
     workflow.add_node("tools", tool_node)
-    workflow.add_edge(START, "agent")
+    workflow.add_conditional_edges(START, route_start, ["summarize", "agent"])
+    workflow.add_edge("summarize", "agent")
     workflow.add_conditional_edges("agent", should_continue)
     workflow.add_edge("tools", "agent")
 
     return workflow.compile(checkpointer=checkpointer)
+
+
+# '''
+# Compiled-graph cache
+# Graphs are keyed on (model, system prompt hash, KB scope) so the same
+# combination reuses one compiled workflow instead of rebuilding it per request
+# '''
+_graph_keys_by_user = {}   # user_id -> graph keys the user has resolved to
+_graph_users_by_key = {}   # graph key -> user_ids, to prune the map above
+_graph_keys_lock = threading.Lock()
+
+
+def _forget_graph_keys(keys):
+    """Remove dropped graphs from the per-user index"""
+    with _graph_keys_lock:
+        for key in keys:
+            for user_id in _graph_users_by_key.pop(key, ()):
+                user_keys = _graph_keys_by_user.get(user_id)
+                if user_keys is None:
+                    continue
+                user_keys.discard(key)
+                if not user_keys:
+                    del _graph_keys_by_user[user_id]
+
+
+_graph_cache = LRUCache(
+    maxsize=GRAPH_CACHE_SIZE, name="graphs", on_evict=lambda key, graph: _forget_graph_keys([key])
+)
+
+
+def _graph_cache_key(modal_name: str, system_prompt: str, filter_user_id: str, use_user_kb: bool):
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+    return (modal_name, prompt_hash, filter_user_id, use_user_kb)
+
+
+def get_cached_workflow(user_id, system_prompt, checkpointer, modal_name: str, filter_user_id, use_user_kb: bool):
+    """
+    Return a compiled workflow for this (model, prompt, KB scope), building it on a miss
+    """
+    key = _graph_cache_key(modal_name, system_prompt, filter_user_id, use_user_kb)
+    graph = _graph_cache.get(key)
+    if graph is None:
+        tools = build_retriever_tools(filter_user_id, use_user_kb)
+        graph = build_workflow(tools, system_prompt, checkpointer, modal_name)
+        _graph_cache.set(key, graph)
+
+    # Indexed after set() so an eviction triggered by this insert cannot race it
+    with _graph_keys_lock:
+        _graph_keys_by_user.setdefault(user_id, set()).add(key)
+        _graph_users_by_key.setdefault(key, set()).add(user_id)
+    return graph
+
+
+def _drop_graphs(predicate):
+    keys = _graph_cache.keys_where(predicate)
+    removed = _graph_cache.pop_where(lambda k: k in keys)
+    _forget_graph_keys(keys)
+    return removed
+
+
+def invalidate_user_graphs(user_id: str):
+    """Drop graphs built for a user's prompts (call after a prompt changes)"""
+    with _graph_keys_lock:
+        keys = set(_graph_keys_by_user.get(user_id, ()))
+    removed = _drop_graphs(lambda k: k in keys)
+    print(f"Invalidated {removed} cached graphs for user {user_id}")
+
+
+def invalidate_scope_graphs(filter_user_id: str):
+    """Drop graphs bound to a KB scope (call after the KB's documents change)"""
+    removed = _drop_graphs(lambda k: k[2] == filter_user_id)
+    print(f"Invalidated {removed} cached graphs for KB {filter_user_id}")
+
+
+def graph_cache_stats():
+    with _graph_keys_lock:
+        indexed_users = len(_graph_keys_by_user)
+    return {**_graph_cache.stats(), "indexed_users": indexed_users}
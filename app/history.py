@@ -0,0 +1,131 @@
+import re
+import threading
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from app.cache import LRUCache
+from app.config import HISTORY_CACHE_SIZE
+from app.checkpointer import get_checkpointer, latest_checkpoint_id
+
+_RERANK_SPLIT_RE = re.compile(r"Rerank Score:")
+_SOURCE_RE = re.compile(r"Source: \{.*?\}")
+
+# thread_id -> formatted history as of a checkpoint
+_history_cache = LRUCache(maxsize=HISTORY_CACHE_SIZE, name="conversation_history")
+_history_lock = threading.Lock()
+
+
+def _new_entry():
+    return {
+        "checkpoint_id": None,
+        "raw_count": 0,        # raw checkpoint messages already formatted
+        "last_raw_id": None,   # id of the last of those, to detect rewritten histories
+        "messages": [],
+        "pending_sources": [], # tool sources waiting for the next AI message
+    }
+
+
+def format_new_messages(entry: dict, raw_messages):
+    """
+    Append raw_messages to a cached entry's formatted history: ToolMessage
+    artifacts become the sources of the next AI reply; user/assistant text
+    is stripped of serialized retrieval output.
+    """
+    for msg in raw_messages:
+        # --- ToolMessage: collect sources ---
+        if isinstance(msg, ToolMessage):
+            if hasattr(msg, "artifact") and msg.artifact:
+                for item in msg.artifact:
+                    metadata = item.get("metadata", {})
+                    entry["pending_sources"].append({
+                        "source": metadata.get("source", "Unknown"),
+                        "rerank_score": item.get("rerank_score", 0),
+                        "tool_message_id": getattr(msg, "id", None)
+                    })
+            continue
+
+        # --- HumanMessage or AIMessage ---
+        if isinstance(msg, (HumanMessage, AIMessage)):
+            content = msg.content or ""
+            clean_text = _RERANK_SPLIT_RE.split(content)[0].strip()
+            clean_text = _SOURCE_RE.sub("", clean_text).strip()
+            if not clean_text:
+                continue
+
+            sorted_sources = []
+            if isinstance(msg, AIMessage):
+                unique_sources = {}
+                for s in entry["pending_sources"]:
+                    name = s["source"]
+                    if name not in unique_sources or s["rerank_score"] > unique_sources[name]["rerank_score"]:
+                        unique_sources[name] = s
+                sorted_sources = sorted(unique_sources.values(), key=lambda x: x["rerank_score"], reverse=True)
+                entry["pending_sources"] = []
+
+            entry["messages"].append({
+                "id": getattr(msg, "id", None),
+                "role": "user" if isinstance(msg, HumanMessage) else "assistant",
+                "content": clean_text,
+                "sources": sorted_sources
+            })
+
+
+async def get_formatted_history(thread_id: str):
+    """
+    Formatted messages of a thread, oldest first.
+    When the newest checkpoint id matches the cached one nothing is loaded;
+    otherwise only the messages added since the cached checkpoint are formatted.
+    """
+    checkpoint_id = await latest_checkpoint_id(thread_id)
+    if checkpoint_id is None:
+        invalidate_history(thread_id)
+        return []
+
+    entry = _history_cache.get(thread_id)
+    if entry is not None and entry["checkpoint_id"] == checkpoint_id:
+        return entry["messages"]
+
+    state = await get_checkpointer().aget_tuple({"configurable": {"thread_id": thread_id}})
+    if not state:
+        return []
+    raw_messages = state.checkpoint.get("channel_values", {}).get("messages", [])
+
+    with _history_lock:
+        entry = _history_cache.get(thread_id)
+        reusable = (
+            entry is not None
+            and entry["raw_count"] <= len(raw_messages)
+            and (entry["raw_count"] == 0
+                 or getattr(raw_messages[entry["raw_count"] - 1], "id", None) == entry["last_raw_id"])
+        )
+        if reusable:
+            # Copy so readers of the previous version never see a half-updated list
+            entry = {**entry, "messages": list(entry["messages"]), "pending_sources": list(entry["pending_sources"])}
+        else:
+            entry = _new_entry()
+
+        format_new_messages(entry, raw_messages[entry["raw_count"]:])
+        entry["raw_count"] = len(raw_messages)
+        entry["last_raw_id"] = getattr(raw_messages[-1], "id", None) if raw_messages else None
+        entry["checkpoint_id"] = state.config["configurable"].get("checkpoint_id", checkpoint_id)
+        _history_cache.set(thread_id, entry)
+    return entry["messages"]
+
+
+def paginate(messages, limit: int, before: int = None):
+    """
+    Newest-first page of `limit` messages ending just before position `before`
+    (default: the newest). Returns (page, next_cursor); next_cursor is None on
+    the last page.
+    """
+    end = len(messages) if before is None else max(0, min(before, len(messages)))
+    start = max(0, end - limit)
+    page = messages[start:end][::-1]
+    return page, (start if start > 0 else None)
+
+
+def invalidate_history(*thread_ids: str):
+    for thread_id in thread_ids:
+        _history_cache.pop(thread_id)
+
+
+def history_cache_stats():
+    return _history_cache.stats()
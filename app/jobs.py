@@ -0,0 +1,239 @@
+"""
+Background jobs (document ingestion, bulk purges) run outside the HTTP request.
+
+Jobs execute in a bounded process pool so parsing and embedding never block
+API workers. Each user has at most JOB_MAX_PER_USER jobs in the pool at a time;
+the rest wait in order, so one heavy uploader cannot starve everyone else.
+Workers report progress through a queue drained by the API process, which
+owns the job records.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.config import (
+    JOB_QUEUE_BACKEND,
+    JOB_WORKERS,
+    JOB_MAX_PER_USER,
+    JOB_HISTORY_SIZE,
+)
+
+
+class MemoryJobStore:
+    """Job records for this API process; the oldest finished jobs are evicted first"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        # Queued and running jobs are never evicted, even past maxsize
+        excess = len(self.jobs) - self.maxsize
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:excess]:
+            del self.jobs[job_id]
+
+    def create(self, kind: str, user_id: str, meta: dict = None):
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "user_id": user_id,
+            "status": "queued",
+            "meta": meta or {},
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+            self._evict()
+        return dict(job)
+
+    def update(self, job_id: str, progress: dict = None, **fields):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            if progress:
+                job["progress"] = {**job["progress"], **progress}
+            job.update(fields)
+            if fields.get("finished_at") is not None:
+                self._evict()
+
+    def mark_running(self, job_id: str, started_at: float):
+        # Progress is delivered asynchronously; never move a finished job back
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job["status"] == "queued":
+                job.update(status="running", started_at=started_at)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else {**job, "progress": dict(job["progress"])}
+
+
+# '''
+# Worker-process side: progress is sent back to the API process
+# '''
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def report_progress(job_id: str, **progress):
+    """Called from job functions running in a worker process"""
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, progress))
+
+
+def _run_job(fn, job_id: str, args):
+    _progress_queue.put((job_id, {"_started_at": time.time()}))
+    return fn(job_id, *args)
+
+
+class LocalJobQueue:
+    """
+    Runs jobs in a local ProcessPoolExecutor (spawned workers, so no forked
+    event loop or connection pools). Job functions are top-level callables
+    taking (job_id, *args) and returning a JSON-serializable result.
+    """
+
+    def __init__(self, store, max_workers: int, per_user_limit: int):
+        self.store = store
+        self.max_workers = max_workers
+        self.per_user_limit = per_user_limit
+        self._pool = None
+        self._progress_queue = None
+        self._user_slots = {}  # user_id -> [Semaphore, jobs holding or waiting for it]
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pool is None:
+                ctx = multiprocessing.get_context("spawn")
+                self._progress_queue = ctx.Queue()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=ctx,
+                    initializer=_init_worker,
+                    initargs=(self._progress_queue,),
+                )
+                threading.Thread(
+                    target=self._drain_progress, args=(self._progress_queue,), daemon=True, name="job-progress"
+                ).start()
+        return self._pool
+
+    def _drain_progress(self, progress_queue):
+        while True:
+            item = progress_queue.get()
+            if item is None:
+                return
+            job_id, progress = item
+            started_at = progress.pop("_started_at", None)
+            if started_at is not None:
+                self.store.mark_running(job_id, started_at)
+            if progress:
+                self.store.update(job_id, progress=progress)
+
+    def submit(self, kind: str, user_id: str, fn, args=(), meta: dict = None, on_success=None):
+        """
+        Queue fn(job_id, *args) and return the job record immediately.
+        on_success(result) runs in the API process, e.g. to invalidate caches.
+        """
+        job = self.store.create(kind, user_id, meta)
+        task = asyncio.create_task(self._run(job["id"], user_id, fn, args, on_success))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _reset_pool(self, broken_pool):
+        """Drop a pool whose worker died so the next job starts a fresh one"""
+        with self._lock:
+            if self._pool is not broken_pool:
+                return
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._progress_queue.put(None)
+            self._pool = None
+            self._progress_queue = None
+        print("Job worker pool broken (worker process died); it will be recreated")
+
+    async def _run(self, job_id: str, user_id: str, fn, args, on_success):
+        slot = self._user_slots.setdefault(user_id, [asyncio.Semaphore(self.per_user_limit), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                pool = self._ensure_pool()
+                loop = asyncio.get_running_loop()
+                try:
+                    result = await loop.run_in_executor(pool, _run_job, fn, job_id, args)
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        self._reset_pool(pool)
+                    print(f"Job {job_id} failed: {e}")
+                    self.store.update(
+                        job_id, status="failed", error=f"{e.__class__.__name__}: {e}", finished_at=time.time()
+                    )
+                    return
+        finally:
+            # Forget idle users so the map does not grow with every user ever seen
+            slot[1] -= 1
+            if slot[1] == 0 and self._user_slots.get(user_id) is slot:
+                del self._user_slots[user_id]
+
+        if on_success is not None:
+            try:
+                on_success(result)
+            except Exception as e:
+                print(f"Job {job_id} completion hook failed: {e}")
+        self.store.update(job_id, status="succeeded", result=result, finished_at=time.time())
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def stats(self):
+        return {
+            "backend": "local",
+            "workers": self.max_workers,
+            "per_user_limit": self.per_user_limit,
+            "pending_or_running": len(self._tasks),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._progress_queue.put(None)
+                self._pool = None
+
+
+_job_queue = None
+
+
+def get_job_queue():
+    """Job queue for the configured backend (JOB_QUEUE_BACKEND)"""
+    global _job_queue
+    if _job_queue is None:
+        if JOB_QUEUE_BACKEND != "local":
+            raise ValueError(f"Unknown job queue backend: {JOB_QUEUE_BACKEND}")
+        _job_queue = LocalJobQueue(MemoryJobStore(JOB_HISTORY_SIZE), JOB_WORKERS, JOB_MAX_PER_USER)
+    return _job_queue
+
+
+def shutdown_job_queue():
+    if _job_queue is not None:
+        _job_queue.shutdown()
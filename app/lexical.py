@@ -0,0 +1,107 @@
+import math
+import re
+import threading
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Common English words carry no signal for product / client name lookups
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "our", "that", "the", "this",
+    "to", "was", "we", "what", "when", "where", "which", "who", "with", "you", "your",
+}
+
+
+def tokenize(text: str):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Incremental in-memory BM25 (Okapi) index over chunk texts.
+    Documents are keyed by an arbitrary hashable key and can be added or removed.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings = {}   # term -> {key: term frequency}
+        self._lengths = {}    # key -> token count
+        self._doc_terms = {}  # key -> terms, so removal only touches its postings
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, key, text: str):
+        counts = Counter(tokenize(text))
+        with self._lock:
+            if key in self._lengths:
+                self._remove(key)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[key] = tf
+            length = sum(counts.values())
+            self._lengths[key] = length
+            self._doc_terms[key] = list(counts)
+            self._total_length += length
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        length = self._lengths.pop(key, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._doc_terms.pop(key, []):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int):
+        """Return [(key, score)] best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._lengths)
+            if not n or not terms:
+                return []
+            avgdl = self._total_length / n
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[key] / avgdl)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+
+def rank_by_bm25(query: str, rows, k: int, text_key: str = "content"):
+    """Rank a small candidate set with BM25 statistics computed over that set only"""
+    index = BM25Index()
+    for i, row in enumerate(rows):
+        index.add(i, row[text_key])
+    return [{**rows[i], "bm25": score} for i, score in index.search(query, k)]
+
+
+def reciprocal_rank_fusion(result_lists, key_fn, k: int = 60):
+    """
+    Merge ranked lists: score(d) = sum over lists of 1 / (k + rank(d)), rank from 1.
+    Returns merged items (first occurrence wins) with an "rrf_score", best first.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, item in enumerate(results, start=1):
+            key = key_fn(item)
+            if key not in fused:
+                fused[key] = {**item, "rrf_score": 0.0}
+            fused[key]["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda x: x["rrf_score"], reverse=True)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+from app.cache import LRUCache
+from app.config import (
+    LOOKUP_CACHE_SIZE,
+    LOOKUP_CACHE_TTL,
+    LOOKUP_CACHE_REDIS_URL,
+)
+
+REDIS_PREFIX = "sh:lookup:"
+_MISSING = object()
+
+
+class LookupCache:
+    """
+    Short-TTL cache for small per-user lookups made before every query
+    (active prompt, admin id, whether a user has documents).
+
+    Entries live in an in-process LRU by default. With a Redis URL (Redis or
+    any compatible server, e.g. a local Valkey) they live in Redis instead, so
+    write-through invalidation reaches every worker process.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, redis_url: str = ""):
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl, name="lookups")
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+    def get(self, key: str, default=None):
+        if self.redis is None:
+            return self.local.get(key, default)
+        try:
+            raw = self.redis.get(REDIS_PREFIX + key)
+        except Exception as e:
+            # Redis down: behave like a miss and go to Supabase
+            self.redis_errors += 1
+            print(f"Lookup cache get failed: {e}")
+            return default
+        if raw is None:
+            self.redis_misses += 1
+            return default
+        self.redis_hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value, ttl: float = None):
+        ttl = ttl or self.ttl
+        if self.redis is None:
+            self.local.set(key, value, ttl=ttl)
+            return
+        try:
+            self.redis.set(REDIS_PREFIX + key, json.dumps(value), ex=max(1, int(ttl)))
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"Lookup cache set failed: {e}")
+
+    def invalidate(self, *keys: str):
+        for key in keys:
+            self.local.pop(key)
+        if self.redis is not None and keys:
+            try:
+                self.redis.delete(*[REDIS_PREFIX + k for k in keys])
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"Lookup cache invalidate failed: {e}")
+
+    def get_or_load(self, key: str, loader, ttl: float = None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value, ttl=ttl)
+        return value
+
+    async def aget_or_load(self, key: str, loader, ttl: float = None):
+        """Async variant: `loader` is a coroutine function; Redis calls run off the loop"""
+        if self.redis is None:
+            value = self.local.get(key, _MISSING)
+        else:
+            value = await asyncio.to_thread(self.get, key, _MISSING)
+        if value is _MISSING:
+            value = await loader()
+            if self.redis is None:
+                self.set(key, value, ttl=ttl)
+            else:
+                await asyncio.to_thread(self.set, key, value, ttl)
+        return value
+
+    def stats(self):
+        if self.redis is None:
+            return {"backend": "memory", **self.local.stats()}
+        lookups = self.redis_hits + self.redis_misses
+        return {
+            "backend": "redis",
+            "hits": self.redis_hits,
+            "misses": self.redis_misses,
+            "errors": self.redis_errors,
+            "hit_rate": round(self.redis_hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+lookup_cache = LookupCache(LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL, LOOKUP_CACHE_REDIS_URL)
+
+
+# '''
+# Cache keys and write-through invalidation hooks
+# '''
+def active_prompt_key(user_id: str) -> str:
+    return f"active_prompt:{user_id}"
+
+
+def has_documents_key(user_id: str) -> str:
+    return f"has_documents:{user_id}"
+
+
+ADMIN_USER_ID_KEY = "admin_user_id"
+
+
+def invalidate_prompt_lookups(user_id: str):
+    lookup_cache.invalidate(active_prompt_key(user_id))
+
+
+def invalidate_document_lookups(user_id: str):
+    if user_id:
+        lookup_cache.invalidate(has_documents_key(user_id))
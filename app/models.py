@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional, List, Any
 from uuid import UUID, uuid4
-from sqlalchemy import Column, DateTime, text, JSON
+from sqlalchemy import Column, DateTime, Index, text, JSON
 from sqlmodel import Field, SQLModel, Relationship, create_engine
 from pgvector.sqlalchemy import Vector # For Supabase Vector support
 
@@ -87,6 +87,14 @@ class KBAccess(SQLModel, table=True):
 
 class Document(SQLModel, table=True):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Full-text index for the lexical half of hybrid retrieval
+        Index(
+            "ix_documents_content_fts",
+            text("to_tsvector('english', content)"),
+            postgresql_using="gin",
+        ),
+    )
     
     id: UUID = Field(default_factory=uuid4, primary_key=True)
     user_id: Optional[str] = Field(default=None, foreign_key="users.id", ondelete="CASCADE")
@@ -94,7 +102,8 @@ class Document(SQLModel, table=True):
     document_metadata: Optional[Any] = Field(default=None, sa_column=Column(JSON))
     embedding: Optional[Any] = Field(default=None, sa_column=Column(Vector(1536)))
     created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
-    file_id: Optional[UUID] = Field(default=None, foreign_key="user_files.id", ondelete="CASCADE")
+    content_hash: Optional[str] = Field(default=None, index=True)  # sha256 of content, used to skip re-embedding
+    file_id: Optional[UUID] = Field(default=None, foreign_key="user_files.id", ondelete="CASCADE", index=True)
 
     user: Optional[User] = Relationship()
     file: Optional[UserFile] = Relationship(back_populates="documents")
@@ -0,0 +1,131 @@
+"""
+Incremental sync of a PDF directory into a KB using a fingerprint manifest.
+
+The manifest records, per file: size, mtime, sha256 and the ids of the chunks
+it produced. A sync only parses and embeds new or modified files and deletes
+the chunks of files that were removed. Files whose size and mtime are
+unchanged are not even hashed.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from app.config import INGEST_STATE_DIR
+from app.data_loader import iter_pdf_files_parallel
+from app.vectorstore_supabase import replace_source_documents, delete_chunk_rows, delete_document_chunks
+
+
+def manifest_path_for(user_id: str = None) -> str:
+    return os.path.join(INGEST_STATE_DIR, f"pdf_manifest_{user_id or 'shared'}.json")
+
+
+def load_manifest(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(path: str, manifest: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def diff_directory(directory_path: str, manifest: dict):
+    """
+    Compare the PDFs on disk with the manifest.
+    Returns {"new", "modified", "removed", "unchanged"} path lists and the
+    fingerprints of new/modified files ({path: {"size", "mtime", "sha256"}}).
+    """
+    diff = {"new": [], "modified": [], "removed": [], "unchanged": []}
+    fingerprints = {}
+    on_disk = set()
+
+    for pdf_file in sorted(Path(directory_path).rglob("*.pdf")):
+        path = str(pdf_file)
+        on_disk.add(path)
+        stat = pdf_file.stat()
+        entry = manifest.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            diff["unchanged"].append(path)
+            continue
+
+        sha256 = file_sha256(path)
+        if entry and entry["sha256"] == sha256:
+            # Touched but identical: refresh the stat fields only
+            entry["mtime"] = stat.st_mtime
+            diff["unchanged"].append(path)
+            continue
+
+        fingerprints[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+        diff["modified" if entry else "new"].append(path)
+
+    diff["removed"] = sorted(p for p in manifest if p not in on_disk)
+    return diff, fingerprints
+
+
+def print_diff(diff: dict):
+    for kind in ("new", "modified", "removed"):
+        for path in diff[kind]:
+            print(f"  {kind:<9} {path}")
+    print(f"{len(diff['new'])} new, {len(diff['modified'])} modified, "
+          f"{len(diff['removed'])} removed, {len(diff['unchanged'])} unchanged")
+
+
+def sync_pdf_directory(directory_path: str, user_id: str = None, dry_run: bool = False, manifest_path: str = None):
+    """
+    Bring the KB in line with directory_path. With dry_run, only print the diff.
+    Returns {"diff", "inserted", "deleted", "errors"}
+    """
+    manifest_path = manifest_path or manifest_path_for(user_id)
+    manifest = load_manifest(manifest_path)
+    diff, fingerprints = diff_directory(directory_path, manifest)
+    print_diff(diff)
+    report = {"diff": diff, "inserted": 0, "deleted": 0, "errors": []}
+    if dry_run:
+        return report
+
+    for path in diff["removed"]:
+        entry = manifest[path]
+        if entry.get("chunk_ids"):
+            report["deleted"] += delete_chunk_rows([{"id": i} for i in entry["chunk_ids"]], user_id)
+        else:
+            report["deleted"] += delete_document_chunks({"metadata->>source": path, "user_id": user_id})
+        del manifest[path]
+        save_manifest(manifest_path, manifest)
+
+    changed = diff["new"] + diff["modified"]
+    for path, pages, error in iter_pdf_files_parallel(directory_path, files=changed):
+        if error:
+            report["errors"].append({"file": path, "error": error})
+            continue
+        for page in pages:
+            page.metadata["source"] = path
+        try:
+            stats = replace_source_documents(pages, path, user_id=user_id)
+        except Exception as e:
+            # Keep the old manifest entry so the file is retried next run
+            report["errors"].append({"file": path, "error": f"{e.__class__.__name__}: {e}"})
+            continue
+        report["inserted"] += stats["inserted"]
+        report["deleted"] += stats["deleted"]
+        manifest[path] = {**fingerprints[path], "chunk_ids": stats["chunk_ids"]}
+        save_manifest(manifest_path, manifest)
+
+    # Persist mtime refreshes of touched-but-identical files
+    save_manifest(manifest_path, manifest)
+    print(f"Sync done: {report['inserted']} chunks inserted, {report['deleted']} deleted, "
+          f"{len(report['errors'])} errors")
+    return report
@@ -0,0 +1,90 @@
+"""
+Bulk purge of everything a user owns, run as a background job.
+
+All database rows (KB chunks, file records, conversations and their
+LangGraph checkpoint threads) are deleted with set-based statements in a
+single Postgres transaction. Storage objects are removed afterwards in
+batches, since Supabase Storage is not transactional.
+"""
+from app.config import SUPABASE_DB_URI, PURGE_STORAGE_BATCH_SIZE, get_supabase
+from app.jobs import report_progress
+
+# LangGraph's Postgres checkpointer tables, all keyed by thread_id
+CHECKPOINT_TABLES = ("checkpoint_writes", "checkpoint_blobs", "checkpoints")
+
+
+def purge_user_rows(conn, user_id: str):
+    """Delete the user's rows in one transaction; returns what storage cleanup and caches need"""
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM documents WHERE user_id = %s RETURNING id::text", (user_id,))
+            chunk_ids = [row[0] for row in cur.fetchall()]
+
+            cur.execute("DELETE FROM user_files WHERE user_id = %s RETURNING storage_path", (user_id,))
+            storage_paths = [row[0] for row in cur.fetchall()]
+
+            # Messages cascade from conversations; conversation ids are checkpoint thread ids
+            cur.execute('DELETE FROM conversations WHERE "userId" = %s RETURNING id', (user_id,))
+            thread_ids = [row[0] for row in cur.fetchall()]
+
+            checkpoint_rows = 0
+            if thread_ids:
+                for table in CHECKPOINT_TABLES:
+                    cur.execute(f"DELETE FROM {table} WHERE thread_id = ANY(%s)", (thread_ids,))
+                    checkpoint_rows += cur.rowcount
+
+    return {
+        "chunk_ids": chunk_ids,
+        "storage_paths": storage_paths,
+        "thread_ids": thread_ids,
+        "checkpoint_rows": checkpoint_rows,
+    }
+
+
+def remove_storage_objects(storage_paths, job_id: str = None):
+    """Remove storage objects in batches; returns the paths that could not be removed"""
+    failed = []
+    bucket = get_supabase().storage.from_("user_documents")
+    for i in range(0, len(storage_paths), PURGE_STORAGE_BATCH_SIZE):
+        batch = storage_paths[i:i + PURGE_STORAGE_BATCH_SIZE]
+        try:
+            bucket.remove(batch)
+        except Exception as e:
+            print(f"Storage removal failed for {len(batch)} objects: {e}")
+            failed.extend(batch)
+        if job_id:
+            report_progress(job_id, storage_objects_processed=min(i + len(batch), len(storage_paths)))
+    return failed
+
+
+def purge_user(job_id: str, user_id: str):
+    """Background job for /admin/delete_user: database rows first, then storage"""
+    import psycopg
+
+    if not SUPABASE_DB_URI:
+        raise ValueError("SUPABASE_DB_URI is not set")
+
+    report_progress(job_id, stage="deleting_rows")
+    with psycopg.connect(SUPABASE_DB_URI, prepare_threshold=0) as conn:
+        rows = purge_user_rows(conn, user_id)
+    report_progress(
+        job_id,
+        stage="removing_storage",
+        chunks_deleted=len(rows["chunk_ids"]),
+        files_deleted=len(rows["storage_paths"]),
+        threads_deleted=len(rows["thread_ids"]),
+        checkpoint_rows_deleted=rows["checkpoint_rows"],
+    )
+
+    failed = remove_storage_objects(rows["storage_paths"], job_id)
+    report_progress(job_id, stage="done", storage_failures=len(failed))
+    return {
+        "user_id": user_id,
+        "chunk_ids": rows["chunk_ids"],
+        "chunks_deleted": len(rows["chunk_ids"]),
+        "files_deleted": len(rows["storage_paths"]),
+        "thread_ids": rows["thread_ids"],
+        "threads_deleted": len(rows["thread_ids"]),
+        "checkpoint_rows_deleted": rows["checkpoint_rows"],
+        "storage_failures": failed,
+    }
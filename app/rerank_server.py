@@ -0,0 +1,128 @@
+"""
+Shared cross-encoder rerank server.
+
+Loads the model once and serves every API worker over a Unix socket or a
+local TCP port. Requests arriving within RERANK_SERVER_MAX_WAIT_MS of each
+other are merged into one predict() call of up to RERANK_SERVER_MAX_BATCH_SIZE
+pairs.
+
+Run with:
+    RERANK_SERVER_ADDRESS=unix:/tmp/sh-rerank.sock python -m app.rerank_server
+"""
+import asyncio
+import json
+import os
+import time
+from app.config import (
+    RERANK_SERVER_ADDRESS,
+    RERANK_SERVER_MAX_BATCH_SIZE,
+    RERANK_SERVER_MAX_WAIT_MS,
+)
+from app.reranker import get_cross_encoder, parse_address, score_pairs, STREAM_LIMIT
+
+
+class MicroBatcher:
+    """
+    Collects (pairs, future) requests and scores them together.
+    A batch is flushed when it reaches max_batch_size pairs or when
+    max_wait_ms has passed since its first request arrived.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.pairs_scored = 0
+
+    async def submit(self, pairs):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((pairs, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+
+            while size < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            all_pairs = [pair for pairs, _ in batch for pair in pairs]
+            try:
+                # One model, one thread: the batch itself is the parallelism
+                scores = await asyncio.to_thread(score_pairs, all_pairs)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.pairs_scored += len(all_pairs)
+            offset = 0
+            for pairs, future in batch:
+                if not future.done():
+                    future.set_result(scores[offset:offset + len(pairs)])
+                offset += len(pairs)
+
+
+async def handle_connection(batcher: MicroBatcher, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                scores = await batcher.submit([tuple(p) for p in request["pairs"]])
+                response = {"scores": scores}
+            except Exception as e:
+                response = {"error": f"{e.__class__.__name__}: {e}"}
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(address: str = RERANK_SERVER_ADDRESS):
+    if not address:
+        raise ValueError("RERANK_SERVER_ADDRESS is not set")
+
+    started = time.perf_counter()
+    get_cross_encoder()
+    print(f"Cross-encoder loaded in {time.perf_counter() - started:.1f}s")
+
+    batcher = MicroBatcher(RERANK_SERVER_MAX_BATCH_SIZE, RERANK_SERVER_MAX_WAIT_MS)
+    handler = lambda r, w: handle_connection(batcher, r, w)
+
+    kind, target = parse_address(address)
+    if kind == "unix":
+        if os.path.exists(target):
+            os.remove(target)
+        server = await asyncio.start_unix_server(handler, path=target, limit=STREAM_LIMIT)
+    else:
+        server = await asyncio.start_server(handler, *target, limit=STREAM_LIMIT)
+
+    print(f"Rerank server listening on {address} "
+          f"(max_batch_size={RERANK_SERVER_MAX_BATCH_SIZE}, max_wait_ms={RERANK_SERVER_MAX_WAIT_MS})")
+    batch_task = asyncio.create_task(batcher.run())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.config import (
+    RERANKER_MODEL,
+    RERANKER_BACKEND,
+    RERANKER_QUANTIZATION,
+    RERANKER_ONNX_DIR,
+    RERANKER_MAX_LENGTH,
+    RERANKER_BATCH_SIZE,
+    RERANK_MAX_WORKERS,
+    RERANK_SERVER_ADDRESS,
+    RERANK_CLIENT_TIMEOUT,
+    RERANK_CACHE_SIZE,
+    RERANK_CACHE_TTL,
+)
+from app.cache import LRUCache
+from app.embedding_cache import normalize_query
+
+# Bounded pool so CPU-bound scoring never runs on the event loop
+_rerank_executor = ThreadPoolExecutor(max_workers=RERANK_MAX_WORKERS, thread_name_prefix="rerank")
+
+# Large enough for a batch of ~500-character chunks on one line
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+
+def load_cross_encoder(backend: str = RERANKER_BACKEND, quantization: str = RERANKER_QUANTIZATION,
+                       max_length: int = RERANKER_MAX_LENGTH, model_name: str = RERANKER_MODEL):
+    """
+    Build a CrossEncoder for the selected backend
+    - "torch": sentence-transformers default (PyTorch)
+    - "onnx": ONNX Runtime on CPU; with `quantization` set, an int8 dynamically
+      quantized copy is exported once into RERANKER_ONNX_DIR and reused
+    Inputs longer than max_length tokens are truncated.
+    """
+    from sentence_transformers import CrossEncoder
+
+    if backend == "torch":
+        return CrossEncoder(model_name, max_length=max_length)
+
+    if backend != "onnx":
+        raise ValueError(f"Unknown reranker backend: {backend}")
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if not quantization:
+        return CrossEncoder(model_name, backend="onnx", max_length=max_length, model_kwargs=model_kwargs)
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    export_dir = os.path.join(RERANKER_ONNX_DIR, model_name.replace("/", "__"))
+    file_name = f"model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(export_dir, "onnx", file_name)):
+        print(f"Exporting int8 ({quantization}) ONNX reranker to {export_dir}...")
+        onnx_model = CrossEncoder(model_name, backend="onnx", model_kwargs=model_kwargs)
+        onnx_model.save_pretrained(export_dir)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization, export_dir)
+
+    model_kwargs["file_name"] = f"onnx/{file_name}"
+    return CrossEncoder(export_dir, backend="onnx", max_length=max_length, model_kwargs=model_kwargs)
+
+
+def get_cross_encoder():
+    """Load the configured cross-encoder on first use (not at import time)"""
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                _cross_encoder = load_cross_encoder()
+    return _cross_encoder
+
+
+def score_pairs(pairs, model=None, batch_size: int = RERANKER_BATCH_SIZE):
+    """
+    Score (query, passage) pairs with the in-process cross-encoder.
+    Pairs are sorted by length before batching so each batch pads to a
+    similar length, then scores are returned in the original order.
+    """
+    if not pairs:
+        return []
+    model = model or get_cross_encoder()
+
+    order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+    sorted_scores = model.predict(
+        [pairs[i] for i in order], batch_size=batch_size, show_progress_bar=False
+    )
+
+    scores = [0.0] * len(pairs)
+    for position, index in enumerate(order):
+        scores[index] = float(sorted_scores[position])
+    return scores
+
+
+async def ascore_pairs_local(pairs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_rerank_executor, score_pairs, pairs)
+
+
+def parse_address(address: str):
+    """'unix:/path.sock' -> ("unix", path); 'host:port' -> ("tcp", (host, port))"""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+async def open_connection(address: str):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target, limit=STREAM_LIMIT)
+    return await asyncio.open_connection(*target, limit=STREAM_LIMIT)
+
+
+class RerankLoad:
+    """
+    Exponentially weighted model of reranker latency as
+    fixed_ms + ms_per_pair * pairs, measured end to end so queueing on a
+    saturated reranker raises the estimate. Calls vary in size (only
+    cache-missing pairs are scored), so the fixed per-call overhead is
+    fitted separately instead of being spread over a handful of pairs.
+    """
+
+    # Below this spread of call sizes (pairs^2) the slope is not trusted
+    MIN_SIZE_VARIANCE = 1.0
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.in_flight = 0
+        self.samples = 0
+        self._mean_pairs = 0.0
+        self._mean_ms = 0.0
+        self._var_pairs = 0.0
+        self._cov = 0.0
+
+    def observe(self, pair_count: int, elapsed_ms: float):
+        if pair_count <= 0:
+            return
+        self.samples += 1
+        if self.samples == 1:
+            self._mean_pairs, self._mean_ms = float(pair_count), elapsed_ms
+            return
+        d_pairs = pair_count - self._mean_pairs
+        d_ms = elapsed_ms - self._mean_ms
+        self._mean_pairs += self.alpha * d_pairs
+        self._mean_ms += self.alpha * d_ms
+        self._var_pairs = (1 - self.alpha) * (self._var_pairs + self.alpha * d_pairs * d_pairs)
+        self._cov = (1 - self.alpha) * (self._cov + self.alpha * d_pairs * d_ms)
+
+    @property
+    def ms_per_pair(self):
+        if not self.samples:
+            return None
+        if self._var_pairs >= self.MIN_SIZE_VARIANCE and self._cov > 0:
+            return min(self._cov / self._var_pairs, self._mean_ms / self._mean_pairs)
+        # Calls of one size: no way to split fixed from per-pair cost yet
+        return self._mean_ms / self._mean_pairs
+
+    @property
+    def fixed_ms(self):
+        if not self.samples:
+            return None
+        return max(0.0, self._mean_ms - self.ms_per_pair * self._mean_pairs)
+
+    def candidate_depth(self, max_depth: int, min_depth: int, budget_ms: float) -> int:
+        """How many candidates fit in the latency budget after the fixed per-call cost"""
+        if not budget_ms or not self.ms_per_pair:
+            return max_depth
+        affordable = int((budget_ms - self.fixed_ms) / self.ms_per_pair)
+        return max(min_depth, min(max_depth, affordable))
+
+
+class RerankClient:
+    """
+    Scores pairs through the shared rerank server (newline-delimited JSON),
+    falling back to in-process scoring when the server is unset or unreachable.
+    After a failure the server is skipped for `retry_after` seconds.
+    """
+
+    def __init__(self, address: str, timeout: float, retry_after: float = 30.0):
+        self.address = address
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._down_until = 0.0
+        self.remote_calls = 0
+        self.fallbacks = 0
+        self.load = RerankLoad()
+
+    async def _score_remote(self, pairs):
+        reader, writer = await open_connection(self.address)
+        try:
+            writer.write(json.dumps({"pairs": pairs}).encode("utf-8") + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+        finally:
+            writer.close()
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["scores"]
+
+    async def ascore(self, pairs):
+        if not pairs:
+            return []
+
+        self.load.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await self._ascore(pairs)
+        finally:
+            self.load.in_flight -= 1
+            self.load.observe(len(pairs), (time.perf_counter() - started) * 1000)
+
+    async def _ascore(self, pairs):
+        if self.address and time.monotonic() >= self._down_until:
+            try:
+                scores = await asyncio.wait_for(self._score_remote(pairs), timeout=self.timeout)
+                self.remote_calls += 1
+                return scores
+            except Exception as e:
+                print(f"Rerank server unavailable ({e.__class__.__name__}: {e}), scoring in-process")
+                self._down_until = time.monotonic() + self.retry_after
+
+        self.fallbacks += 1
+        return await ascore_pairs_local(pairs)
+
+    def stats(self):
+        return {
+            "address": self.address or None,
+            "remote_calls": self.remote_calls,
+            "local_calls": self.fallbacks,
+            "server_down": bool(self.address) and time.monotonic() < self._down_until,
+            "in_flight": self.load.in_flight,
+            "ms_per_pair": round(self.load.ms_per_pair, 3) if self.load.ms_per_pair else None,
+            "fixed_ms": round(self.load.fixed_ms, 3) if self.load.fixed_ms is not None else None,
+        }
+
+
+rerank_client = RerankClient(RERANK_SERVER_ADDRESS, RERANK_CLIENT_TIMEOUT)
+
+
+def chunk_cache_key(doc) -> str:
+    """Chunk identity: its documents.id when known, otherwise a hash of its content"""
+    if doc.get("id"):
+        return str(doc["id"])
+    return hashlib.sha256(doc["page_content"].encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """
+    Cross-encoder scores keyed by (normalized query hash, chunk key),
+    with TTL and LRU eviction. Chunks are dropped explicitly when deleted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl, name="rerank_scores")
+
+    @staticmethod
+    def query_key(query: str) -> str:
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+    def get_many(self, query: str, docs):
+        """Return cached scores aligned with docs (None where missing)"""
+        qkey = self.query_key(query)
+        return [self.cache.get((qkey, chunk_cache_key(d))) for d in docs]
+
+    def set_many(self, query: str, docs, scores):
+        qkey = self.query_key(query)
+        for doc, score in zip(docs, scores):
+            self.cache.set((qkey, chunk_cache_key(doc)), score)
+
+    def invalidate_chunks(self, chunk_keys):
+        chunk_keys = {str(k) for k in chunk_keys if k}
+        if not chunk_keys:
+            return 0
+        return self.cache.pop_where(lambda k: k[1] in chunk_keys)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+rerank_score_cache = RerankScoreCache(RERANK_CACHE_SIZE, RERANK_CACHE_TTL)
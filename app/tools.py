@@ -1,11 +1,24 @@
+import asyncio
 from langchain.tools import tool
-from app.config import (supabase, cross_encoder, embeddings)
+from app.config import (
+    get_supabase,
+    get_async_supabase,
+    RETRIEVAL_CANDIDATE_K,
+    RETRIEVAL_FINAL_K,
+    RERANK_LATENCY_BUDGET_MS,
+    HYBRID_RETRIEVAL,
+    LEXICAL_CANDIDATE_K,
+    LEXICAL_FETCH_FACTOR,
+    RRF_K,
+    ADMIN_ID_CACHE_TTL,
+)
+from app.lookup_cache import lookup_cache, has_documents_key, ADMIN_USER_ID_KEY
+from app.lexical import tokenize, rank_by_bm25, reciprocal_rank_fusion
+from app.embedding_cache import query_embedding_cache
+from app.ann_mirror import get_fresh_mirror
+from app.reranker import score_pairs, rerank_client, rerank_score_cache
 
-def rerank_with_cross_encoder(query, docs):
-    """Re-rank documents using cross-encoder"""
-    print("Re-Ranking the results...")
-    pairs = [(query, d["page_content"]) for d in docs]
-    scores = cross_encoder.predict(pairs)
+def _apply_rerank_scores(docs, scores):
     ranked = [
         {**doc, "rerank_score": float(score)}
         for doc, score in zip(docs, scores)
@@ -13,10 +26,43 @@ def rerank_with_cross_encoder(query, docs):
     ranked.sort(key=lambda x: x["rerank_score"], reverse=True)
     return ranked
 
+def rerank_with_cross_encoder(query, docs):
+    """Re-rank documents using cross-encoder"""
+    print("Re-Ranking the results...")
+    pairs = [(query, d["page_content"]) for d in docs]
+    return _apply_rerank_scores(docs, score_pairs(pairs))
+
+async def arerank_with_cross_encoder(query, docs):
+    """
+    Re-rank documents via the shared rerank server (or in-process fallback),
+    only scoring (query, chunk) pairs missing from the score cache
+    """
+    print("Re-Ranking the results...")
+    scores = rerank_score_cache.get_many(query, docs)
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        missing_docs = [docs[i] for i in missing]
+        fresh = await rerank_client.ascore([(query, d["page_content"]) for d in missing_docs])
+        rerank_score_cache.set_many(query, missing_docs, fresh)
+        for i, score in zip(missing, fresh):
+            scores[i] = score
+    print(f"Rerank cache: {len(docs) - len(missing)}/{len(docs)} scores reused")
+    return _apply_rerank_scores(docs, scores)
+
 def check_user_has_documents(user_id: str) -> bool:
-    """Check if user has their own KB"""
-    response = supabase.table("documents").select("id").eq("user_id", user_id).limit(1).execute()
-    return len(response.data) > 0
+    """Check if user has their own KB (cached, invalidated on ingest/delete)"""
+    def load():
+        response = get_supabase().table("documents").select("id").eq("user_id", user_id).limit(1).execute()
+        return len(response.data) > 0
+    return lookup_cache.get_or_load(has_documents_key(user_id), load)
+
+async def acheck_user_has_documents(user_id: str) -> bool:
+    """Async variant of check_user_has_documents"""
+    async def load():
+        client = await get_async_supabase()
+        response = await client.table("documents").select("id").eq("user_id", user_id).limit(1).execute()
+        return len(response.data) > 0
+    return await lookup_cache.aget_or_load(has_documents_key(user_id), load)
 
 def check_user_has_access_to_default(user_id: str)-> bool:
     """
@@ -27,7 +73,7 @@ def check_user_has_access_to_default(user_id: str)-> bool:
     :return: Description
     :rtype: bool
     """
-    response = supabase.table("kb_accesses").select("has_access_to_default_kb").eq("user_id", user_id).execute()
+    response = get_supabase().table("kb_accesses").select("has_access_to_default_kb").eq("user_id", user_id).execute()
     if response.data and response.data[0]["has_access_to_default_kb"]:
         return True
     else:
@@ -37,21 +83,34 @@ def get_admin_user_id():
     """
     Docstring for get_admin_user_id
     """
-    res = supabase.table("users").select("id").eq("role", "admin").single().execute()
+    def load():
+        res = get_supabase().table("users").select("id").eq("role", "admin").single().execute()
+        return res.data["id"]
 
-    return res.data["id"]
+    return lookup_cache.get_or_load(ADMIN_USER_ID_KEY, load, ttl=ADMIN_ID_CACHE_TTL)
 
+async def aget_admin_user_id():
+    """Async variant of get_admin_user_id"""
+    async def load():
+        client = await get_async_supabase()
+        res = await client.table("users").select("id").eq("role", "admin").single().execute()
+        return res.data["id"]
 
-def create_retriever_tool(user_id: str = None, force_user_kb: bool = False):
+    return await lookup_cache.aget_or_load(ADMIN_USER_ID_KEY, load, ttl=ADMIN_ID_CACHE_TTL)
+
+
+def resolve_kb_scope(user_id: str = None, force_user_kb: bool = False):
     """
-    Create retriever tool for specific user or default KB
+    Resolve which KB a request retrieves from
     
     Args:
         user_id: User ID
         force_user_kb: If True, force use of user KB (if available). 
                       If False, use default KB.
-    """
     
+    Returns:
+        (filter_user_id, use_user_kb)
+    """
     use_user_kb = False
     filter_user_id = None
 
@@ -64,41 +123,150 @@ def create_retriever_tool(user_id: str = None, force_user_kb: bool = False):
         print("Admin User Id: ", user_id)
         filter_user_id = user_id
 
-    kb_type = f"user-specific KB (user_id={user_id})" if use_user_kb else f"Admin-specific KB (user_id={filter_user_id})"
+    return filter_user_id, use_user_kb
+
+
+async def aresolve_kb_scope(user_id: str = None, force_user_kb: bool = False):
+    """Async variant of resolve_kb_scope used by the /query path"""
+    use_user_kb = False
+    filter_user_id = None
+
+    if force_user_kb and user_id:
+        use_user_kb = await acheck_user_has_documents(user_id)
+        filter_user_id = user_id
+
+    if not force_user_kb:
+        filter_user_id = await aget_admin_user_id()
+        print("Admin User Id: ", filter_user_id)
+
+    return filter_user_id, use_user_kb
+
+
+def create_retriever_tool(user_id: str = None, force_user_kb: bool = False):
+    """
+    Create retriever tool for specific user or default KB
+    
+    Args:
+        user_id: User ID
+        force_user_kb: If True, force use of user KB (if available). 
+                      If False, use default KB.
+    """
+    filter_user_id, use_user_kb = resolve_kb_scope(user_id, force_user_kb)
+    return build_retriever_tools(filter_user_id, use_user_kb)
+
+
+def candidate_key(row):
+    return row.get("id") or row["content"]
+
+
+async def vector_candidates(query_embedding, filter_user_id: str, depth: int, mirror=None):
+    """Dense candidates from the hot-KB mirror when fresh, otherwise match_documents"""
+    if mirror is not None:
+        return mirror.search(query_embedding, depth)
+
+    client = await get_async_supabase()
+    response = await client.rpc(
+        "match_documents",
+        {
+            "query_embedding": query_embedding,
+            "match_count": depth,
+            "filter_user_id": filter_user_id
+        }
+    ).execute()
+    return response.data or []
+
+
+async def lexical_candidates(query: str, filter_user_id: str, depth: int, mirror=None):
+    """
+    BM25 candidates: from the mirror's local index, or via Postgres full-text
+    search on documents.content (any query term), ranked with BM25 locally
+    """
+    if mirror is not None:
+        return mirror.lexical_search(query, depth)
+
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    client = await get_async_supabase()
+    request = client.table("documents").select("id, content, metadata")
+    request = request.eq("user_id", filter_user_id) if filter_user_id else request.is_("user_id", "null")
+    try:
+        response = await (
+            request
+            .text_search("content", " | ".join(terms), options={"config": "english"})
+            .limit(depth * LEXICAL_FETCH_FACTOR)
+            .execute()
+        )
+    except Exception as e:
+        # Lexical search is best-effort; dense results still answer the query
+        print(f"Lexical search failed: {e}")
+        return []
+    return rank_by_bm25(query, response.data or [], depth)
+
+
+def build_retriever_tools(filter_user_id: str, use_user_kb: bool):
+    """
+    Build the retriever tool bound to a resolved KB scope
+    """
+    kb_type = f"user-specific KB (user_id={filter_user_id})" if use_user_kb else f"Admin-specific KB (user_id={filter_user_id})"
     
     print(f"Using {kb_type}")
     
     @tool(response_format="content_and_artifact")
-    def retrieve_documents(query: str):
+    async def retrieve_documents(query: str):
         """Retrieve relevant documents from Supabase vector database based on semantic similarity."""
-        query_embedding = embeddings.embed_query(query)
         print(f"Retrieving from {kb_type}...")
         
-        response = supabase.rpc(
-            "match_documents",
-            {
-                "query_embedding": query_embedding,
-                "match_count": 3,
-                "filter_user_id": filter_user_id
-            }
-        ).execute()
+        # Stage 1: over-fetch candidates, fewer when the reranker is saturated
+        candidate_depth = rerank_client.load.candidate_depth(
+            RETRIEVAL_CANDIDATE_K, RETRIEVAL_FINAL_K, RERANK_LATENCY_BUDGET_MS
+        )
+        mirror = get_fresh_mirror(filter_user_id)
+
+        async def vector_search():
+            query_embedding = await query_embedding_cache.aembed_query(query)
+            return await vector_candidates(query_embedding, filter_user_id, candidate_depth, mirror)
+
+        if HYBRID_RETRIEVAL:
+            # Dense and lexical search run concurrently, then merge by reciprocal rank
+            vector_hits, lexical_hits = await asyncio.gather(
+                vector_search(),
+                lexical_candidates(query, filter_user_id, LEXICAL_CANDIDATE_K, mirror),
+            )
+            candidates = reciprocal_rank_fusion(
+                [vector_hits, lexical_hits], key_fn=candidate_key, k=RRF_K
+            )[:candidate_depth]
+        else:
+            vector_hits, lexical_hits = await vector_search(), []
+            candidates = vector_hits
         
-        if not response.data:
+        if not candidates:
             return "No matching documents found.", []
         
-        print(f"Got {len(response.data)} documents from {kb_type}")
+        print(f"Got {len(candidates)} candidates (depth {candidate_depth}, {len(vector_hits)} vector, "
+              f"{len(lexical_hits)} lexical) from {kb_type}{' mirror' if mirror else ''}")
         
+        vector_ranks = {candidate_key(d): rank for rank, d in enumerate(vector_hits)}
+        lexical_ranks = {candidate_key(d): rank for rank, d in enumerate(lexical_hits)}
         docs = []
-        for doc in response.data:
+        for doc in candidates:
             docs.append({
+                "id": doc.get("id"),
                 "page_content": doc["content"],
                 "metadata": doc["metadata"],
-                "similarity": doc["similarity"]
+                "similarity": doc.get("similarity"),
+                "vector_rank": vector_ranks.get(candidate_key(doc)),
+                "lexical_rank": lexical_ranks.get(candidate_key(doc)),
+                "rrf_score": doc.get("rrf_score"),
+                "candidate_depth": candidate_depth,
             })
         
-        # Rerank and get top 3
-        reranked = rerank_with_cross_encoder(query, docs)
-        top_docs = reranked[:3]
+        # Stage 2: rerank candidates and keep the final k
+        reranked = await arerank_with_cross_encoder(query, docs)
+        for rank, doc in enumerate(reranked):
+            doc["rerank_rank"] = rank
+        top_docs = reranked[:RETRIEVAL_FINAL_K]
         
         serialized = "\n\n".join(
             f"Rerank Score: {d['rerank_score']:.3f}\nSource: {d['metadata']}\nContent: {d['page_content']}"
@@ -71,7 +71,9 @@ def launch_ui(app, config):
             with open(file_path, "wb") as f:
                 f.write(file.read())
 
-        pdf_docs = load_pdfs_from_directory(PDF_DIR)
+        pdf_docs, errors = load_pdfs_from_directory(PDF_DIR, parallel=True)
+        for error in errors:
+            print(f"Skipped {error['file']}: {error['error']}")
         retriever = build_vectorstore(pdf_docs)
         tools = create_retriever_tool(retriever)
         new_workflow = build_workflow(tools, EMAIL_SYSTEM_PROMPT)
@@ -1,15 +1,14 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from app.config import get_embeddings
 
 
 def build_vectorstore(docs, chunk_size=500, chunk_overlap=50):
+    # Local import: only the Gradio prototype builds an in-memory FAISS store
+    from langchain_community.vectorstores import FAISS
+
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
     doc_splits = text_splitter.split_documents(docs)
-    embeddings = OpenAIEmbeddings()
-    # embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vector_store = FAISS.from_documents(doc_splits, embeddings)
+    vector_store = FAISS.from_documents(doc_splits, get_embeddings())
     return vector_store.as_retriever(search_kwargs={"k": 2})
@@ -1,16 +1,37 @@
 import os
-from supabase import create_client
-from langchain_openai import OpenAIEmbeddings
+import time
+import random
+import hashlib
+import uuid
+import openai
+from concurrent.futures import ThreadPoolExecutor
+from postgrest.types import ReturnMethod
 from langchain_community.vectorstores import SupabaseVectorStore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from app.config import (supabase, embeddings)
+from app.config import (
+    get_supabase,
+    get_embeddings,
+    get_async_supabase,
+    EMBED_BATCH_SIZE,
+    EMBED_CONCURRENCY,
+    EMBED_MAX_RETRIES,
+    INSERT_PAGE_SIZE,
+)
+from app.reranker import rerank_score_cache
+from app.ann_mirror import remove_from_mirrors
+from app.lookup_cache import (
+    lookup_cache,
+    active_prompt_key,
+    invalidate_prompt_lookups,
+    invalidate_document_lookups,
+)
 
 
 def fetch_conversation_messages(conversation_id: str, limit: int = 10):
     print("fetching current conversations last 10 messages...")
     try:
         response = (
-        supabase
+        get_supabase()
         .table("messages")
         .select("role, content")
         .eq("conversationId", conversation_id)
@@ -33,56 +54,439 @@ def clean_metadata(docs):
         cleaned_docs.append(doc)
     return cleaned_docs
 
-def create_or_load_vectorstore(docs=None, user_id: str = None):
+def embed_with_retry(texts, max_retries: int = EMBED_MAX_RETRIES):
     """
-    Create or load vectorstore
+    Embed a batch of texts, backing off exponentially (with jitter)
+    on OpenAI rate limits, timeouts and connection errors
+    """
+    delay = 1.0
+    for attempt in range(max_retries + 1):
+        try:
+            return get_embeddings().embed_documents(texts)
+        except (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError) as e:
+            if attempt == max_retries:
+                raise
+            wait = delay + random.uniform(0, delay / 2)
+            print(f"Embedding batch failed ({e.__class__.__name__}), retry {attempt + 1}/{max_retries} in {wait:.1f}s")
+            time.sleep(wait)
+            delay = min(delay * 2, 60)
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Keeps the `in.(...)` filter of a hash lookup well under URL length limits
+HASH_LOOKUP_PAGE_SIZE = 100
+
+
+def _select_by_hashes(columns: str, hashes, user_id: str = None, apply_filter=None):
+    """Rows of this KB whose content_hash is in hashes, fetched in pages"""
+    rows = []
+    hashes = list(hashes)
+    for i in range(0, len(hashes), HASH_LOOKUP_PAGE_SIZE):
+        query = (
+            get_supabase().table("documents")
+            .select(columns)
+            .in_("content_hash", hashes[i:i + HASH_LOOKUP_PAGE_SIZE])
+        )
+        query = query.eq("user_id", user_id) if user_id else query.is_("user_id", "null")
+        if apply_filter is not None:
+            query = apply_filter(query)
+        rows.extend(query.execute().data)
+    return rows
+
+
+def find_existing_hashes(hashes, user_id: str = None, source: str = None, file_id: str = None):
+    """
+    Bulk-lookup content hashes already stored for this KB (and uploaded file or source)
+    Returns {content_hash: document_id}
+    """
+    if file_id is not None:
+        apply_filter = lambda q: q.eq("file_id", file_id)
+    elif source is not None:
+        apply_filter = lambda q: q.eq("metadata->>source", source)
+    else:
+        apply_filter = None
+    rows = _select_by_hashes("id, content_hash", hashes, user_id, apply_filter)
+    return {row["content_hash"]: row["id"] for row in rows}
+
+
+def find_stored_embeddings(hashes, user_id: str = None):
+    """
+    Embeddings already stored anywhere in this KB for these content hashes
+    Returns {content_hash: embedding}
+    """
+    rows = _select_by_hashes("content_hash, embedding", hashes, user_id)
+    return {row["content_hash"]: row["embedding"] for row in rows}
+
+
+def dedupe_chunks(chunks, user_id: str = None, file_id: str = None):
+    """
+    Drop chunks whose content is already stored for the same KB and source
+    (or uploaded file, when file_id is given), plus repeats within this batch.
+    Returns (new_chunks, skipped_count)
+    """
+    by_source = {}
+    for chunk in chunks:
+        key = None if file_id else chunk.metadata.get("source")
+        by_source.setdefault(key, []).append(chunk)
+
+    new_chunks = []
+    skipped = 0
+    for source, group in by_source.items():
+        hashes = [hash_text(c.page_content) for c in group]
+        seen = set(find_existing_hashes(set(hashes), user_id=user_id, source=source, file_id=file_id))
+        for chunk, content_hash in zip(group, hashes):
+            if content_hash in seen:
+                skipped += 1
+                continue
+            seen.add(content_hash)
+            new_chunks.append(chunk)
+    return new_chunks, skipped
+
+
+def ingest_chunks(chunks, user_id: str = None, file_id: str = None, reuse_embeddings: bool = False):
+    """
+    Embed chunks in batches of EMBED_BATCH_SIZE (EMBED_CONCURRENCY batches in flight)
+    and insert them in pages of INSERT_PAGE_SIZE rows, tagged with the
+    user_files row they came from (file_id) when there is one.
+    With reuse_embeddings, chunks whose content is already stored elsewhere in
+    the KB (e.g. an earlier upload of the same PDF) copy that embedding
+    instead of calling OpenAI again.
+    Callers dedupe by content hash first, so re-running a failed ingestion
+    only embeds the chunks that never landed.
+    """
+    table_name = "documents"
+    start = time.perf_counter()
+    inserted = 0
+    reused = 0
+    pending_rows = []
+
+    hashed = [(c, hash_text(c.page_content)) for c in chunks]
+    stored = find_stored_embeddings({h for _, h in hashed}, user_id=user_id) if reuse_embeddings and chunks else {}
+
+    def flush(rows):
+        nonlocal inserted
+        get_supabase().table(table_name).insert(rows).execute()
+        inserted += len(rows)
+
+    window_size = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as pool:
+        for window_start in range(0, len(chunks), window_size):
+            window = hashed[window_start:window_start + window_size]
+            to_embed = [c.page_content for c, h in window if h not in stored]
+            batches = [to_embed[i:i + EMBED_BATCH_SIZE] for i in range(0, len(to_embed), EMBED_BATCH_SIZE)]
+            vectors = iter(v for batch_vectors in pool.map(embed_with_retry, batches) for v in batch_vectors)
+
+            for chunk, content_hash in window:
+                if content_hash in stored:
+                    vector = stored[content_hash]
+                    reused += 1
+                else:
+                    vector = next(vectors)
+                pending_rows.append({
+                    "content": chunk.page_content,
+                    "metadata": chunk.metadata,
+                    "embedding": vector,
+                    "user_id": user_id,
+                    "file_id": file_id,
+                    "content_hash": content_hash
+                })
+                if len(pending_rows) >= INSERT_PAGE_SIZE:
+                    flush(pending_rows)
+                    pending_rows = []
+
+            elapsed = time.perf_counter() - start
+            print(f"Ingested {inserted + len(pending_rows)}/{len(chunks)} chunks ({(inserted + len(pending_rows)) / max(elapsed, 1e-6):.1f} chunks/sec)")
+
+    if pending_rows:
+        flush(pending_rows)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "chunks": len(chunks),
+        "inserted": inserted,
+        "reused_embeddings": reused,
+        "seconds": round(elapsed, 2),
+        "chunks_per_sec": round(inserted / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    print(f"Inserted {inserted} documents into Supabase for user_id={user_id} "
+          f"({reused} embeddings reused, {stats['chunks_per_sec']} chunks/sec)")
+    return stats
+
+
+def split_documents(docs):
+    """Split documents into overlapping 500-character chunks"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=500,
+        chunk_overlap=50
+    )
+    return text_splitter.split_documents(docs)
+
+
+def ingest_documents(docs, user_id: str = None):
+    """
+    Split, embed and store documents
     - user_id = None → default/shared KB
     - user_id = str → user-specific KB
+    Chunks already stored for the same KB and source are skipped (content hash).
+    Returns ingestion stats (chunks, inserted, skipped, seconds, chunks_per_sec)
     """
-    table_name = "documents"
+    print("Splitting docs...")
+    chunks = split_documents(docs)
+
+    # Add user_id to metadata of each chunk
+    for chunk in chunks:
+        chunk.metadata["user_id"] = user_id  # can be None for shared KB
+
+    new_chunks, skipped = dedupe_chunks(chunks, user_id=user_id)
+    print(f"{len(new_chunks)} new chunks, {skipped} unchanged chunks skipped")
+
+    stats = ingest_chunks(new_chunks, user_id=user_id)
+    invalidate_document_lookups(user_id)
+    stats["chunks"] = len(chunks)
+    stats["skipped"] = skipped
+    return stats
 
-    if docs:
-        # Split documents into chunks
-        print("Splitting docs...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50
-        )
-        chunks = text_splitter.split_documents(docs)
 
-        # Add user_id to metadata of each chunk
+def ingest_document_stream(pages, user_id: str = None, on_progress=None, file_id: str = None):
+    """
+    Split, dedupe, embed and insert documents as they are yielded (e.g. PDF
+    pages from iter_pdf_pages), one window of EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+    chunks at a time, so memory stays bounded regardless of file size.
+    Chunks keep their page's metadata. Re-running after a failure re-inserts
+    nothing that already landed (content-hash dedupe scoped to file_id), and
+    content already stored elsewhere in the KB reuses its embedding.
+    on_progress(totals) is called after every window.
+    Returns ingestion stats (pages, chunks, inserted, reused_embeddings, skipped, seconds, chunks_per_sec)
+    """
+    window_size = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+    start = time.perf_counter()
+    totals = {"pages": 0, "chunks": 0, "inserted": 0, "reused_embeddings": 0, "skipped": 0}
+    window = []
+
+    def drain():
+        new_chunks, skipped = dedupe_chunks(window, user_id=user_id, file_id=file_id)
+        stats = ingest_chunks(new_chunks, user_id=user_id, file_id=file_id, reuse_embeddings=True)
+        totals["inserted"] += stats["inserted"]
+        totals["reused_embeddings"] += stats["reused_embeddings"]
+        totals["skipped"] += skipped
+        if on_progress is not None:
+            on_progress(dict(totals))
+
+    for page in pages:
+        chunks = split_documents([page])
         for chunk in chunks:
             chunk.metadata["user_id"] = user_id  # can be None for shared KB
+        window.extend(chunks)
+        totals["pages"] += 1
+        totals["chunks"] += len(chunks)
+        if len(window) >= window_size:
+            drain()
+            window = []
+
+    if window:
+        drain()
+    invalidate_document_lookups(user_id)
+
+    elapsed = time.perf_counter() - start
+    totals["seconds"] = round(elapsed, 2)
+    totals["chunks_per_sec"] = round(totals["inserted"] / elapsed, 2) if elapsed > 0 else 0.0
+    print(f"Streamed {totals['pages']} pages: {totals['inserted']} chunks inserted, {totals['skipped']} skipped")
+    return totals
+
+
+def ingest_uploaded_file(job_id: str, temp_path: str, filename: str, content_type: str, user_id: str):
+    """
+    Background ingestion job for /upload_user_document (runs in a job worker):
+    store the spooled file, record it in user_files, then stream its pages
+    into the user's KB. The spooled file is always removed.
+    """
+    from app.data_loader import iter_pdf_pages
+    from app.jobs import report_progress
+
+    try:
+        report_progress(job_id, stage="storing")
+        storage_path = f"{user_id}/{uuid.uuid4()}-{filename}"
+        get_supabase().storage.from_("user_documents").upload(
+            storage_path,
+            temp_path,
+            {"content-type": content_type},
+        )
+        file_row = get_supabase().table("user_files").insert({
+            "user_id": user_id,
+            "filename": filename,
+            "storage_path": storage_path
+        }).execute().data[0]
+
+        report_progress(job_id, stage="ingesting", file_id=file_row["id"])
+        pages = iter_pdf_pages(temp_path, source=filename)
+        stats = ingest_document_stream(
+            pages,
+            user_id=user_id,
+            file_id=file_row["id"],
+            on_progress=lambda totals: report_progress(job_id, **totals),
+        )
+        report_progress(job_id, stage="done", **stats)
+        return {"file": filename, "file_id": file_row["id"], **stats}
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# PostgREST returns at most this many rows per request
+SELECT_PAGE_SIZE = 1000
+
+
+def delete_document_chunks(match: dict):
+    """
+    Delete chunks matching `match` (e.g. {"metadata->>source": name, "user_id": id})
+    and drop cached rerank scores for them. Returns the number of chunks deleted.
+    """
+    chunk_keys = _delete_chunks_where(lambda q: q.match(match))
+    rerank_score_cache.invalidate_chunks(chunk_keys)
+    if match.get("user_id"):
+        remove_from_mirrors(match["user_id"], chunk_keys[::2])
+        invalidate_document_lookups(match["user_id"])
+    return len(chunk_keys) // 2
+
+
+def _delete_chunks_where(apply_filter):
+    """
+    Page through (id, content_hash) of the chunks selected by apply_filter(query),
+    then delete them with a single request. Returns the cache keys of deleted chunks.
+    """
+    chunk_keys = []
+    offset = 0
+    while True:
+        query = apply_filter(get_supabase().table("documents").select("id, content_hash"))
+        page = query.order("id").range(offset, offset + SELECT_PAGE_SIZE - 1).execute().data
+        for row in page:
+            chunk_keys.append(row["id"])
+            chunk_keys.append(row.get("content_hash"))
+        if len(page) < SELECT_PAGE_SIZE:
+            break
+        offset += SELECT_PAGE_SIZE
+
+    if chunk_keys:
+        apply_filter(get_supabase().table("documents").delete(returning=ReturnMethod.minimal)).execute()
+    return chunk_keys
+
+
+def delete_file_chunks(file_ids, user_id: str = None, legacy_sources=None):
+    """
+    Delete every chunk produced by the given user_files rows, filtering on the
+    indexed documents.file_id column (one delete per batch of file ids).
+    legacy_sources: file names whose chunks predate file_id; those are matched
+    by source among the user's chunks without a file_id.
+    Returns the number of chunks deleted.
+    """
+    file_ids = [str(f) for f in file_ids]
+    chunk_keys = []
+    for i in range(0, len(file_ids), HASH_LOOKUP_PAGE_SIZE):
+        batch = file_ids[i:i + HASH_LOOKUP_PAGE_SIZE]
+        chunk_keys += _delete_chunks_where(lambda q: q.in_("file_id", batch))
+
+    legacy_sources = list(legacy_sources or [])
+    if legacy_sources and user_id:
+        for i in range(0, len(legacy_sources), HASH_LOOKUP_PAGE_SIZE):
+            batch = legacy_sources[i:i + HASH_LOOKUP_PAGE_SIZE]
+            chunk_keys += _delete_chunks_where(
+                lambda q: q.eq("user_id", user_id).is_("file_id", "null").in_("metadata->>source", batch)
+            )
+
+    rerank_score_cache.invalidate_chunks(chunk_keys)
+    if user_id:
+        remove_from_mirrors(user_id, chunk_keys[::2])
+        invalidate_document_lookups(user_id)
+    return len(chunk_keys) // 2
+
+
+def select_source_chunks(source: str, user_id: str = None):
+    """All (id, content_hash) rows stored for one source in a KB"""
+    rows = []
+    offset = 0
+    while True:
+        query = get_supabase().table("documents").select("id, content_hash").eq("metadata->>source", source)
+        query = query.eq("user_id", user_id) if user_id else query.is_("user_id", "null")
+        page = query.order("id").range(offset, offset + SELECT_PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < SELECT_PAGE_SIZE:
+            return rows
+        offset += SELECT_PAGE_SIZE
+
+
+def delete_chunk_rows(rows, user_id: str = None):
+    """Delete chunks by id (rows with "id" and "content_hash") and drop them from caches and mirrors"""
+    ids = [row["id"] for row in rows]
+    for i in range(0, len(ids), HASH_LOOKUP_PAGE_SIZE):
+        (
+            get_supabase().table("documents")
+            .delete(returning=ReturnMethod.minimal)
+            .in_("id", ids[i:i + HASH_LOOKUP_PAGE_SIZE])
+            .execute()
+        )
+    rerank_score_cache.invalidate_chunks(ids + [row.get("content_hash") for row in rows])
+    if user_id and ids:
+        remove_from_mirrors(user_id, ids)
+        invalidate_document_lookups(user_id)
+    return len(ids)
+
+
+def replace_source_documents(docs, source: str, user_id: str = None):
+    """
+    Make the stored chunks of one source (file name or URL) match `docs`:
+    new chunks are embedded and inserted, unchanged ones are kept and chunks
+    that no longer appear are deleted.
+    Returns ingestion stats plus "deleted" and the source's current "chunk_ids"
+    """
+    chunks = split_documents(docs)
+    for chunk in chunks:
+        chunk.metadata["user_id"] = user_id
+
+    new_chunks, skipped = dedupe_chunks(chunks, user_id=user_id)
+    stats = ingest_chunks(new_chunks, user_id=user_id)
+
+    keep = {hash_text(c.page_content) for c in chunks}
+    stale, kept_ids = [], []
+    for row in select_source_chunks(source, user_id):
+        if row.get("content_hash") in keep:
+            kept_ids.append(row["id"])
+        else:
+            stale.append(row)
+    stats["deleted"] = delete_chunk_rows(stale, user_id)
+    stats["chunk_ids"] = kept_ids
+    stats["chunks"] = len(chunks)
+    stats["skipped"] = skipped
+    invalidate_document_lookups(user_id)
+    print(f"{source}: {stats['inserted']} chunks inserted, {skipped} kept, {stats['deleted']} deleted")
+    return stats
 
-        # Prepare data for direct insertion
-        print("Rows...")
-        rows_to_insert = []
-        for chunk in chunks:
-            rows_to_insert.append({
-                "content": chunk.page_content,
-                "metadata": chunk.metadata,
-                "embedding": embeddings.embed_documents([chunk.page_content])[0],
-                "user_id": user_id
-            })
 
-        # Insert into Supabase
-        print("Starting storing...")
-        res = supabase.table(table_name).insert(rows_to_insert).execute()
+def create_or_load_vectorstore(docs=None, user_id: str = None):
+    """
+    Create or load vectorstore
+    - user_id = None → default/shared KB
+    - user_id = str → user-specific KB
+    """
+    table_name = "documents"
 
-        print(f"Inserted {len(chunks)} documents into Supabase for user_id={user_id}")
+    if docs:
+        ingest_documents(docs, user_id=user_id)
 
         # Create vectorstore from inserted documents
         vectorstore = SupabaseVectorStore(
-            embedding=embeddings,
-            client=supabase,
+            embedding=get_embeddings(),
+            client=get_supabase(),
             table_name=table_name,
         )
 
     else:
         # Just load existing vectorstore
         vectorstore = SupabaseVectorStore(
-            embedding=embeddings,
-            client=supabase,
+            embedding=get_embeddings(),
+            client=get_supabase(),
             table_name=table_name,
         )
         print("Loaded existing Supabase vector store.")
@@ -92,8 +496,8 @@ def create_or_load_vectorstore(docs=None, user_id: str = None):
 def get_vectorstore(docs=None):
     table_name = "documents"
     vectorstore = SupabaseVectorStore(
-        embedding=embeddings,
-        client=supabase,
+        embedding=get_embeddings(),
+        client=get_supabase(),
         table_name=table_name,
     )
     print("Supabase vector store loaded successfully.")
@@ -102,8 +506,8 @@ def get_vectorstore(docs=None):
 def load_vectorstore():
     table_name = "documents"
     vectorstore = SupabaseVectorStore(
-        embedding=embeddings,
-        client=supabase,
+        embedding=get_embeddings(),
+        client=get_supabase(),
         table_name=table_name,
     )
     print("Supabase vector store loaded successfully.")
@@ -113,7 +517,7 @@ def load_vectorstore():
 
 def add_prompt(name: str, prompt: str, user_id: str):
     # existing = (
-    #     supabase.table("prompts")
+    #     get_supabase().table("prompts")
     #     .select("id")
     #     .eq("name", name)
     #     .eq("user_id", user_id)
@@ -125,16 +529,17 @@ def add_prompt(name: str, prompt: str, user_id: str):
     #     return {"error": f"Prompt '{name}' already exists for this user."}
 
     res = (
-        supabase.table("prompts")
+        get_supabase().table("prompts")
         .insert({"name": name, "prompt": prompt, "user_id": user_id})
         .execute()
     )
+    invalidate_prompt_lookups(user_id)
 
     return {"message": f"Prompt '{name}' added successfully.", "data": res.data}
 
 def get_prompts(user_id: str):
     res = (
-        supabase.table("prompts")
+        get_supabase().table("prompts")
         .select("id, name, prompt, is_active")
         .eq("user_id", user_id)
         .execute()
@@ -145,7 +550,7 @@ def get_prompts(user_id: str):
 
 def edit_prompt(old_name: str, new_prompt: str, user_id: str):
     existing = (
-        supabase.table("prompts")
+        get_supabase().table("prompts")
         .select("id")
         .eq("name", old_name)
         .eq("user_id", user_id)
@@ -158,12 +563,13 @@ def edit_prompt(old_name: str, new_prompt: str, user_id: str):
     update_data = {"prompt": new_prompt}
 
     res = (
-        supabase.table("prompts")
+        get_supabase().table("prompts")
         .update(update_data)
         .eq("name", old_name)
         .eq("user_id", user_id)
         .execute()
     )
+    invalidate_prompt_lookups(user_id)
 
     return {"message": f"Prompt '{old_name}' updated successfully.", "data": res.data}
 
@@ -171,7 +577,7 @@ def edit_prompt(old_name: str, new_prompt: str, user_id: str):
 
 def delete_prompt(name: str, user_id: str):
     existing = (
-        supabase.table("prompts")
+        get_supabase().table("prompts")
         .select("id")
         .eq("name", name)
         .eq("user_id", user_id)
@@ -181,22 +587,24 @@ def delete_prompt(name: str, user_id: str):
     if not existing.data:
         return {"error": f"Prompt '{name}' not found for this user."}
 
-    supabase.table("prompts").delete().eq("name", name).eq("user_id", user_id).execute()
+    get_supabase().table("prompts").delete().eq("name", name).eq("user_id", user_id).execute()
+    invalidate_prompt_lookups(user_id)
 
     return {"message": f"Prompt '{name}' deleted successfully."}
 
 
 
 def set_active_prompt(name: str, user_id: str):
-    supabase.table("prompts").update({"is_active": False}).eq("user_id", user_id).execute()
+    get_supabase().table("prompts").update({"is_active": False}).eq("user_id", user_id).execute()
 
     target = (
-        supabase.table("prompts")
+        get_supabase().table("prompts")
         .update({"is_active": True})
         .eq("name", name)
         .eq("user_id", user_id)
         .execute()
     )
+    invalidate_prompt_lookups(user_id)
 
     if not target.data:
         return {"error": f"Prompt '{name}' not found for this user."}
@@ -206,16 +614,39 @@ def set_active_prompt(name: str, user_id: str):
 
 
 def get_active_prompt(user_id: str):
-    res = (
-        supabase.table("prompts")
-        .select("name, prompt")
-        .eq("is_active", True)
-        .eq("user_id", user_id)
-        .limit(1)
-        .execute()
-    )
+    def load():
+        res = (
+            get_supabase().table("prompts")
+            .select("name, prompt")
+            .eq("is_active", True)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+
+        if not res.data:
+            return {"error": "No active prompt found."}
+
+        return {"active_prompt": res.data[0]}
+
+    return lookup_cache.get_or_load(active_prompt_key(user_id), load)
+
+
+async def aget_active_prompt(user_id: str):
+    async def load():
+        client = await get_async_supabase()
+        res = await (
+            client.table("prompts")
+            .select("name, prompt")
+            .eq("is_active", True)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+
+        if not res.data:
+            return {"error": "No active prompt found."}
 
-    if not res.data:
-        return {"error": "No active prompt found."}
+        return {"active_prompt": res.data[0]}
 
-    return {"active_prompt": res.data[0]}
\ No newline at end of file
+    return await lookup_cache.aget_or_load(active_prompt_key(user_id), load)
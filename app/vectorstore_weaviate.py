@@ -1,6 +1,8 @@
 import os
+import hashlib
 from weaviate import connect_to_weaviate_cloud
 from weaviate.classes.config import Property, DataType
+from weaviate.classes.query import Filter
 from langchain_openai import OpenAIEmbeddings
 from langchain_weaviate import WeaviateVectorStore
 from app.config import WEAVIATE_URL, WEAVIATE_API_KEY
@@ -62,8 +64,59 @@ def ensure_schema(client):
                 Property(name="page_content", data_type=DataType.TEXT),
                 Property(name="source", data_type=DataType.TEXT),
                 Property(name="creationdate", data_type=DataType.TEXT),
+                Property(name="doc_hash", data_type=DataType.TEXT),
             ],
         )
+        return
+
+    # Collections created before content hashing need the doc_hash property
+    collection = client.collections.get(class_name)
+    existing = {p.name for p in collection.config.get().properties}
+    if "doc_hash" not in existing:
+        collection.config.add_property(Property(name="doc_hash", data_type=DataType.TEXT))
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Hashes per `contains_any` filter when looking up existing objects
+HASH_LOOKUP_PAGE_SIZE = 100
+
+
+def find_existing_hashes(collection, hashes):
+    """Bulk-lookup which doc_hash values are already stored in the collection"""
+    existing = set()
+    hashes = list(hashes)
+    for i in range(0, len(hashes), HASH_LOOKUP_PAGE_SIZE):
+        page = hashes[i:i + HASH_LOOKUP_PAGE_SIZE]
+        result = collection.query.fetch_objects(
+            filters=Filter.by_property("doc_hash").contains_any(page),
+            return_properties=["doc_hash"],
+            limit=len(page),
+        )
+        existing.update(o.properties["doc_hash"] for o in result.objects)
+    return existing
+
+
+def dedupe_documents(collection, docs):
+    """
+    Tag docs with a content hash and drop those already stored (or repeated
+    in this batch). Returns (new_docs, skipped_count)
+    """
+    hashes = [hash_text(doc.page_content) for doc in docs]
+    seen = find_existing_hashes(collection, set(hashes))
+
+    new_docs = []
+    skipped = 0
+    for doc, doc_hash in zip(docs, hashes):
+        if doc_hash in seen:
+            skipped += 1
+            continue
+        seen.add(doc_hash)
+        doc.metadata["doc_hash"] = doc_hash
+        new_docs.append(doc)
+    return new_docs, skipped
 
 
 def clean_metadata(docs):
@@ -104,8 +157,11 @@ def create_or_load_vectorstore(docs=None):
     if docs:
         docs = clean_metadata(docs)
         try:
+            new_docs, skipped = dedupe_documents(client.collections.get(index_name), docs)
             print("Adding data...")
-            vectorstore.add_documents(docs)
+            if new_docs:
+                vectorstore.add_documents(new_docs)
+            print(f"Added {len(new_docs)} new documents, skipped {skipped} duplicates.")
         except Exception as e:
             print("Failed to upload some documents:", e)
         finally:
@@ -154,86 +210,3 @@ def load_vectorstore():
     except Exception:
         print("ERROR")
     # return vectorstore.as_retriever(search_kwargs={"k": 3})
-
-
-# import hashlib
-# from weaviate import connect_to_weaviate_cloud
-# from weaviate.classes.config import Property, DataType
-# from langchain_openai import OpenAIEmbeddings
-# from langchain_weaviate import WeaviateVectorStore
-# from app.config import WEAVIATE_URL, WEAVIATE_API_KEY
-# from weaviate.classes.query import Filter
-
-# def hash_text(text: str) -> str:
-#     return hashlib.sha256(text.encode("utf-8")).hexdigest()
-
-# def get_weaviate_client():
-#     return connect_to_weaviate_cloud(
-#         cluster_url=WEAVIATE_URL,
-#         auth_credentials=WEAVIATE_API_KEY,
-#     )
-
-# def create_or_load_vectorstore(docs):
-#     print("🔗 Connecting to Weaviate Cloud...")
-#     client = get_weaviate_client()
-#     collection_name = "StrategisthubDocs"
-
-#     existing_collections = [c.name for c in client.collections.list_all()]
-#     if collection_name not in existing_collections:
-#         print("🆕 Creating new collection in Weaviate...")
-#         client.collections.create(
-#             name=collection_name,
-#             properties=[
-#                 Property(name="text", data_type=DataType.TEXT),
-#                 Property(name="source", data_type=DataType.TEXT),
-#                 Property(name="doc_hash", data_type=DataType.TEXT),
-#             ],
-#             vectorizer_config=None,  # We’re using external embeddings
-#         )
-#     else:
-#         print("📚 Using existing collection (no rebuild)")
-
-#     collection = client.collections.get(collection_name)
-#     embeddings = OpenAIEmbeddings()
-#     inserted, skipped = 0, 0
-
-#     for doc in docs:
-#         text = doc.page_content.strip()
-#         if not text:
-#             continue
-
-#         doc_hash = hash_text(text)
-#         existing = collection.query.fetch_objects(
-#             filters=Filter.by_property("doc_hash").equal(doc_hash),
-#             limit=1
-#         )
-
-#         if existing.objects:
-#             skipped += 1
-#             continue
-
-#         vector = embeddings.embed_query(text)
-#         source = doc.metadata.get("source", "unknown")
-
-#         collection.data.insert(
-#             properties={
-#                 "text": text,
-#                 "source": source,
-#                 "doc_hash": doc_hash,
-#             },
-#             vector=vector,
-#         )
-#         inserted += 1
-
-#     print(f"✅ Added {inserted} new documents, skipped {skipped} duplicates.")
-#     client.close()
-
-#     retriever_client = get_weaviate_client()
-#     vector_store = WeaviateVectorStore(
-#         client=retriever_client,
-#         index_name=collection_name,
-#         text_key="text",
-#         embedding=embeddings,
-#     )
-
-#     return vector_store.as_retriever(search_kwargs={"k": 2})
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from app.config import (
+    get_supabase,
+    get_async_supabase,
+    get_embeddings,
+    WARMUP_RERANKER,
+    RERANK_SERVER_ADDRESS,
+)
+
+_timings = {}
+
+
+async def _timed(name: str, fn, required: bool = True):
+    started = time.perf_counter()
+    try:
+        if asyncio.iscoroutinefunction(fn):
+            await fn()
+        else:
+            await asyncio.to_thread(fn)
+    except Exception as e:
+        if required:
+            raise
+        # Optional pieces load lazily on first use instead
+        print(f"Warm-up of {name} failed: {e}")
+        return
+    _timings[name] = round(time.perf_counter() - started, 3)
+
+
+async def warm_up():
+    """
+    Build the heavyweight clients and models concurrently before serving, so
+    the first request doesn't pay for them. Supabase is required; the
+    cross-encoder is only loaded here when no shared rerank server is configured,
+    and the tiktoken encoding used for context-window metrics is fetched here
+    rather than on the first model call.
+    """
+    from app.reranker import get_cross_encoder
+    from app.context_window import get_token_encoding
+
+    started = time.perf_counter()
+    steps = [
+        _timed("supabase", get_supabase),
+        _timed("async_supabase", get_async_supabase),
+        _timed("embeddings", get_embeddings),
+        # Token counting falls back to an estimate if this cannot be fetched
+        _timed("token_encoding", get_token_encoding, required=False),
+    ]
+    if WARMUP_RERANKER and not RERANK_SERVER_ADDRESS:
+        steps.append(_timed("cross_encoder", get_cross_encoder, required=False))
+    await asyncio.gather(*steps)
+
+    _timings["total"] = round(time.perf_counter() - started, 3)
+    print(f"Warm-up finished in {_timings['total']:.2f}s: {_timings}")
+
+
+def warmup_stats():
+    return dict(_timings)
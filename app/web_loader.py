@@ -0,0 +1,146 @@
+"""
+Concurrent website loading with a conditional-GET cache.
+
+Pages are fetched with one shared httpx.AsyncClient (bounded connection pool)
+and at most WEB_CRAWL_PER_HOST requests per host at a time. Each URL's ETag,
+Last-Modified and content hash are kept in a JSON cache file, so a refresh
+only returns pages the server reports as changed (no 304) whose text actually
+differs, and only those need re-embedding.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from urllib.parse import urlparse
+from langchain_core.documents import Document
+from app.config import (
+    WEB_CACHE_PATH,
+    WEB_CRAWL_MAX_CONNECTIONS,
+    WEB_CRAWL_PER_HOST,
+    WEB_CRAWL_TIMEOUT_S,
+)
+
+USER_AGENT = "Mozilla/5.0 (compatible; StrategisthubKB/1.0)"
+
+
+class WebCache:
+    """
+    URL -> {"etag", "last_modified", "content_hash"} stored as JSON.
+    Entries for fetched pages are staged and only written by commit(), so a
+    failed ingest doesn't mark pages as already embedded.
+    """
+
+    def __init__(self, path: str = WEB_CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self.staged = {}
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def get(self, url: str):
+        return self.entries.get(url)
+
+    def stage(self, url: str, entry: dict):
+        self.staged[url] = entry
+
+    def commit(self, urls=None):
+        """Persist staged entries (all, or only `urls`)"""
+        for url in list(self.staged):
+            if urls is None or url in urls:
+                self.entries[url] = self.staged.pop(url)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def html_to_document(url: str, html: str) -> Document:
+    """Extract text and metadata the same way WebBaseLoader does"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+    if soup.title and soup.title.string:
+        metadata["title"] = soup.title.get_text()
+    description = soup.find("meta", attrs={"name": "description"})
+    if description is not None:
+        metadata["description"] = description.get("content", "No description found.")
+    html_tag = soup.find("html")
+    if html_tag is not None:
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+async def _fetch_page(client, url: str, cache: WebCache, host_slots: dict, force: bool):
+    entry = None if force else cache.get(url)
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    host = urlparse(url).netloc
+    slots = host_slots.setdefault(host, asyncio.Semaphore(WEB_CRAWL_PER_HOST))
+    async with slots:
+        response = await client.get(url, headers=headers)
+
+    if response.status_code == 304:
+        return "not_modified", None
+    response.raise_for_status()
+
+    html = response.text
+    content_hash = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    cache.stage(url, {
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "content_hash": content_hash,
+    })
+    if entry and entry.get("content_hash") == content_hash:
+        # Server ignored the validators but the page is identical
+        return "unchanged", None
+
+    return "changed", await asyncio.to_thread(html_to_document, url, html)
+
+
+async def aload_from_websites(urls, cache: WebCache = None, force: bool = False):
+    """
+    Fetch urls concurrently and return (changed_docs, report).
+    report has "changed", "not_modified", "unchanged" URL lists and "errors"
+    ({"url", "error"}). Call cache.commit() once the changed docs are stored.
+    """
+    import httpx
+
+    cache = cache or WebCache()
+    report = {"changed": [], "not_modified": [], "unchanged": [], "errors": []}
+    docs = []
+    host_slots = {}
+
+    limits = httpx.Limits(max_connections=WEB_CRAWL_MAX_CONNECTIONS)
+    async with httpx.AsyncClient(
+        limits=limits,
+        timeout=WEB_CRAWL_TIMEOUT_S,
+        follow_redirects=True,
+        headers={"User-Agent": USER_AGENT},
+    ) as client:
+        results = await asyncio.gather(
+            *[_fetch_page(client, url, cache, host_slots, force) for url in urls],
+            return_exceptions=True,
+        )
+
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            report["errors"].append({"url": url, "error": f"{result.__class__.__name__}: {result}"})
+            continue
+        status, doc = result
+        report[status].append(url)
+        if doc is not None:
+            docs.append(doc)
+
+    print(f"Fetched {len(urls)} pages: {len(report['changed'])} changed, "
+          f"{len(report['not_modified']) + len(report['unchanged'])} unchanged, {len(report['errors'])} errors")
+    return docs, report
@@ -0,0 +1,152 @@
+"""
+Compare reranker backends against the current production path: the
+sentence-transformers (torch) model at its full 512-token input length.
+
+Reports per-query latency (p50/p95), pairs/sec and ranking agreement:
+top-k overlap and Spearman rank correlation with the baseline ordering.
+
+    python -m benchmarks.reranker
+    python -m benchmarks.reranker --pairs-file queries.jsonl --candidates 30 --top-k 3
+    python -m benchmarks.reranker --quantization avx2 --max-length 256
+
+--pairs-file is JSONL with {"query": str, "passages": [str, ...]} per line.
+Without it a synthetic sales-style set is used.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from app.config import RERANKER_QUANTIZATION
+from app.reranker import load_cross_encoder, score_pairs
+
+# Untruncated torch model, i.e. what was serving before backend selection existed
+BASELINE_MAX_LENGTH = 512
+QUANTIZATION_CHOICES = ("avx2", "avx512", "avx512_vnni", "arm64")
+
+SAMPLE_QUERIES = [
+    "case study for a healthcare client like Aura Health",
+    "what digital marketing services do you offer",
+    "pricing for SEO and content strategy",
+    "examples of ecommerce growth campaigns",
+    "who is on the strategist hub leadership team",
+    "how do you measure paid social performance",
+]
+
+SAMPLE_FRAGMENTS = [
+    "Aura Health partnered with us to grow patient sign-ups through paid search.",
+    "Our services include SEO, content strategy, paid social and conversion optimisation.",
+    "We increased ecommerce revenue by 140% in six months with lifecycle email.",
+    "Pricing depends on scope; most retainers start with a discovery workshop.",
+    "Our leadership team has two decades of experience in growth marketing.",
+    "Paid social performance is tracked against CAC, ROAS and incremental lift.",
+    "The blog covers analytics, attribution and marketing automation best practice.",
+    "We build landing pages and run A/B tests to improve conversion rates.",
+]
+
+
+def synthetic_dataset(candidates: int, seed: int = 7):
+    rng = random.Random(seed)
+    data = []
+    for query in SAMPLE_QUERIES:
+        passages = []
+        for _ in range(candidates):
+            passages.append(" ".join(rng.sample(SAMPLE_FRAGMENTS, k=rng.randint(1, 4))))
+        data.append({"query": query, "passages": passages})
+    return data
+
+
+def load_dataset(path: str, candidates: int):
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [{"query": r["query"], "passages": r["passages"][:candidates]} for r in rows]
+
+
+def ranks(scores):
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    result = [0] * len(scores)
+    for rank, index in enumerate(order):
+        result[index] = rank
+    return result
+
+
+def spearman(a, b):
+    n = len(a)
+    if n < 2:
+        return 1.0
+    ra, rb = ranks(a), ranks(b)
+    d2 = sum((x - y) ** 2 for x, y in zip(ra, rb))
+    return 1 - (6 * d2) / (n * (n * n - 1))
+
+
+def top_k(scores, k):
+    return set(sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k])
+
+
+def run_variant(model, dataset, repeats: int):
+    latencies = []
+    all_scores = []
+    pairs_total = 0
+    for item in dataset:
+        pairs = [(item["query"], p) for p in item["passages"]]
+        score_pairs(pairs, model=model)  # warm-up
+        for _ in range(repeats):
+            started = time.perf_counter()
+            scores = score_pairs(pairs, model=model)
+            latencies.append((time.perf_counter() - started) * 1000)
+            pairs_total += len(pairs)
+        all_scores.append(scores)
+    return latencies, all_scores, pairs_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs-file", help="JSONL with query and passages")
+    parser.add_argument("--candidates", type=int, default=30, help="passages per query")
+    parser.add_argument("--top-k", type=int, default=3, help="k for top-k agreement")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-length", type=int, default=None,
+                        help="max length for the candidate variants (default: RERANKER_MAX_LENGTH)")
+    parser.add_argument("--quantization", choices=QUANTIZATION_CHOICES, default=RERANKER_QUANTIZATION or "avx2",
+                        help="int8 kernel for the onnx-int8 variant; pick one your CPU supports")
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.pairs_file, args.candidates) if args.pairs_file else synthetic_dataset(args.candidates)
+    load_kwargs = {"max_length": args.max_length} if args.max_length else {}
+
+    variants = [
+        ("baseline", "torch", "", {"max_length": BASELINE_MAX_LENGTH}),
+        ("torch", "torch", "", load_kwargs),
+        ("onnx", "onnx", "", load_kwargs),
+        (f"onnx-int8-{args.quantization}", "onnx", args.quantization, load_kwargs),
+    ]
+
+    baseline_scores = None
+    print(f"{'backend':<20} {'load_s':>7} {'p50_ms':>8} {'p95_ms':>8} {'pairs/s':>9} {'top-k':>7} {'spearman':>9}")
+    for name, backend, quantization, kwargs in variants:
+        try:
+            started = time.perf_counter()
+            model = load_cross_encoder(backend=backend, quantization=quantization, **kwargs)
+            load_s = time.perf_counter() - started
+        except Exception as e:
+            print(f"{name:<20} skipped: {e.__class__.__name__}: {e}")
+            continue
+
+        latencies, scores, pairs_total = run_variant(model, dataset, args.repeats)
+        latencies.sort()
+        p50 = statistics.median(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        throughput = pairs_total / (sum(latencies) / 1000)
+
+        if baseline_scores is None:
+            baseline_scores = scores
+        overlap = statistics.mean(
+            len(top_k(s, args.top_k) & top_k(b, args.top_k)) / args.top_k
+            for s, b in zip(scores, baseline_scores)
+        )
+        rho = statistics.mean(spearman(s, b) for s, b in zip(scores, baseline_scores))
+        print(f"{name:<20} {load_s:>7.1f} {p50:>8.1f} {p95:>8.1f} {throughput:>9.0f} {overlap:>7.2f} {rho:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
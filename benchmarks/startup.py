@@ -0,0 +1,82 @@
+"""
+Measure service startup cost.
+
+Each run uses a fresh interpreter and reports:
+- import time of app.config and of main (the FastAPI app module)
+- time-to-ready: from launching uvicorn until /health answers, which
+  includes the lifespan warm-up (clients, cross-encoder, checkpointer)
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 5 --skip-ready
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def import_seconds(module: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def ready_seconds(port: int, timeout: float) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/health"
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError(f"/health not ready after {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(name: str, samples):
+    print(f"{name:<16} {statistics.median(samples):>8.2f} {min(samples):>8.2f} {max(samples):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=int(os.getenv("BENCH_PORT", "8799")))
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--skip-ready", action="store_true", help="only measure import time")
+    args = parser.parse_args()
+
+    results = {
+        "import app.config": [import_seconds("app.config") for _ in range(args.runs)],
+        "import main": [import_seconds("main") for _ in range(args.runs)],
+    }
+    if not args.skip_ready:
+        results["time-to-ready"] = [ready_seconds(args.port, args.timeout) for _ in range(args.runs)]
+
+    print(f"{'seconds':<16} {'median':>8} {'min':>8} {'max':>8}")
+    for name, samples in results.items():
+        summarize(name, samples)
+
+
+if __name__ == "__main__":
+    main()
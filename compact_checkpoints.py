@@ -0,0 +1,37 @@
+"""
+Compact the LangGraph checkpoint tables.
+
+Keeps the newest CHECKPOINT_KEEP_LAST checkpoints per thread, drops threads
+idle for more than CHECKPOINT_RETENTION_DAYS, removes orphaned blobs and
+writes, and reports the rows and bytes reclaimed:
+
+    python compact_checkpoints.py --dry-run     # report only, nothing is deleted
+    python compact_checkpoints.py --vacuum
+    python compact_checkpoints.py --keep-last 1 --retention-days 30
+"""
+import argparse
+from app.config import CHECKPOINT_KEEP_LAST, CHECKPOINT_RETENTION_DAYS, CHECKPOINT_COMPACT_IDLE_S
+from app.checkpoint_retention import compact_checkpoints, print_report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep-last", type=int, default=CHECKPOINT_KEEP_LAST,
+                        help="checkpoints kept per thread (0 = keep all)")
+    parser.add_argument("--retention-days", type=int, default=CHECKPOINT_RETENTION_DAYS,
+                        help="drop threads whose last checkpoint is older than this (0 = never)")
+    parser.add_argument("--idle-seconds", type=int, default=CHECKPOINT_COMPACT_IDLE_S,
+                        help="skip threads with a checkpoint newer than this")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM (ANALYZE) the tables afterwards")
+    parser.add_argument("--dry-run", action="store_true", help="roll back instead of committing")
+    args = parser.parse_args()
+
+    report = compact_checkpoints(
+        keep_last=args.keep_last,
+        retention_days=args.retention_days,
+        idle_seconds=args.idle_seconds,
+        vacuum=args.vacuum,
+        dry_run=args.dry_run,
+    )
+    print("Dry run, nothing deleted:" if args.dry_run else "Checkpoint compaction:")
+    print_report(report)
@@ -1,17 +1,24 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-import re
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
+import json
+import asyncio
+from langchain_core.messages import HumanMessage, SystemMessage
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from langchain_openai import ChatOpenAI
-from langchain_core.documents import Document
 from app.config import PDF_DIR
-from app.data_loader import read_uploaded_file, clean_text, clean_metadata
-from app.tools import create_retriever_tool, check_user_has_documents, check_user_has_access_to_default
-from app.graph_builder import build_workflow
+from app.data_loader import clean_metadata
+from app.tools import aresolve_kb_scope, check_user_has_documents, check_user_has_access_to_default
+from app.graph_builder import (
+    get_cached_workflow,
+    invalidate_user_graphs,
+    invalidate_scope_graphs,
+    graph_cache_stats,
+)
 import os
+import shutil
+import tempfile
 import uvicorn
 import warnings
-import uuid
 
 from app.schema import (
     QueryRequest,
@@ -21,22 +28,59 @@ from app.schema import (
 )
 
 from app.vectorstore_supabase import (
-    create_or_load_vectorstore,
+    ingest_uploaded_file,
+    delete_file_chunks,
     add_prompt,
     get_prompts,
     edit_prompt,
     delete_prompt,
     set_active_prompt,
     get_active_prompt,
+    aget_active_prompt,
 )
 from app.config import (
-    supabase,SUPABASE_DB_URI,
+    get_supabase,
+    UPLOAD_SPOOL_DIR,
+)
+from app.embedding_cache import query_embedding_cache
+from app.reranker import rerank_client, rerank_score_cache
+from app.ann_mirror import start_mirrors, stop_mirrors, mirror_stats
+from app.warmup import warm_up, warmup_stats
+from app.lookup_cache import lookup_cache, invalidate_document_lookups
+from app.jobs import get_job_queue, shutdown_job_queue
+from app.purge import purge_user
+from app.context_window import context_stats
+from app.checkpoint_retention import start_checkpoint_compaction, stop_checkpoint_compaction, compaction_stats
+from app.history import get_formatted_history, paginate, invalidate_history, history_cache_stats
+from app.ann_mirror import remove_from_mirrors
+from app.checkpointer import (
+    open_checkpointer,
+    get_checkpointer,
+    close_checkpointer,
+    get_pool_stats,
 )
+from contextlib import asynccontextmanager
 warnings.filterwarnings("ignore", category=DeprecationWarning)
-from langgraph.checkpoint.postgres import PostgresSaver 
 
 
-app = FastAPI(title="Strategisthub Email Assistant API")
+# '''
+# Warm up clients/models, then open the pooled checkpointer (and run its
+# migrations) once per process; optionally schedule checkpoint compaction
+# '''
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up()
+    await open_checkpointer()
+    await start_mirrors()
+    start_checkpoint_compaction(on_expired=lambda thread_ids: invalidate_history(*thread_ids))
+    yield
+    await stop_checkpoint_compaction()
+    shutdown_job_queue()
+    await stop_mirrors()
+    await close_checkpointer()
+
+
+app = FastAPI(title="Strategisthub Email Assistant API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -47,17 +91,13 @@ app.add_middleware(
 )
 
 # '''
-# Get Answer from user-specific or default DB by AI
-# Fetch active prompt for user
-# If kb_type is "custom", use user-specific KB if exists, else default KB
-# If kb_type is "default", always use default KB
+# Resolve active prompt and KB scope for a query
+# and return the cached compiled graph plus its thread config
 # '''
-@app.post("/query")
-async def handle_query(request: QueryRequest):
-    """Handle user query with user-specific or default KB"""
+async def prepare_query_graph(request: QueryRequest):
     print(f"received model name: {request.model}")
     # Get active prompt
-    active_prompt_data = get_active_prompt(request.user_id)
+    active_prompt_data = await aget_active_prompt(request.user_id)
     if (
         not active_prompt_data
         or "active_prompt" not in active_prompt_data
@@ -71,112 +111,168 @@ async def handle_query(request: QueryRequest):
     if request.kb_type == "custom":
         use_user_kb = True
     
-    tools = create_retriever_tool(user_id=request.user_id, force_user_kb=use_user_kb)
+    filter_user_id, has_user_kb = await aresolve_kb_scope(user_id=request.user_id, force_user_kb=use_user_kb)
  
-    with PostgresSaver.from_conn_string(SUPABASE_DB_URI) as checkpointer:  
-        checkpointer.setup()
-        graph = build_workflow(tools, system_prompt, checkpointer, request.model)
-        config = {"configurable": {"thread_id": request.conversation_id}}
-        result = graph.invoke({"messages": request.query}, config=config)
-        # result = graph.invoke({"messages": messages}, config=config)
-        messages = result["messages"]
-        
-        final_ai_msg = None
+    checkpointer = get_checkpointer()
+    graph = get_cached_workflow(
+        request.user_id, system_prompt, checkpointer, request.model, filter_user_id, has_user_kb
+    )
+    config = {"configurable": {"thread_id": request.conversation_id}}
+    return graph, config
+
+
+def collect_sources(artifacts):
+    """Deduplicate retrieved chunks by source and sort by rerank score"""
+    sources = []
+    for artifact in artifacts:
+        for item in artifact or []:
+            sources.append({
+                "source": item["metadata"].get("source"),
+                "page": item["metadata"].get("page_label"),
+                "content": item["page_content"],
+                "rerank_score": item.get("rerank_score")
+            })
+    
+    unique = {}
+    for s in sources:
+        key = s["source"]
+        if key not in unique:
+            unique[key] = s
+    
+    sources = list(unique.values())
+    return sorted(sources, key=lambda x: x.get("rerank_score", 0), reverse=True)
+
+
+# '''
+# Get Answer from user-specific or default DB by AI
+# Fetch active prompt for user
+# If kb_type is "custom", use user-specific KB if exists, else default KB
+# If kb_type is "default", always use default KB
+# '''
+@app.post("/query")
+async def handle_query(request: QueryRequest):
+    """Handle user query with user-specific or default KB"""
+    graph, config = await prepare_query_graph(request)
+    result = await graph.ainvoke({"messages": request.query}, config=config)
+    # result = graph.invoke({"messages": messages}, config=config)
+    messages = result["messages"]
+    
+    final_ai_msg = None
+    final_msg_id = None
+    for msg in messages:
+        if msg.__class__.__name__ == "AIMessage" and msg.content:
+            final_ai_msg = msg.content
+            final_msg_id = msg.id
+            # print("Final AI Message: ", msg.id)
+    
+    sources = []
+    if request.kb_type == "custom":
+        sources = collect_sources(
+            msg.artifact for msg in messages
+            if msg.__class__.__name__ == "ToolMessage" and getattr(msg, "artifact", None)
+        )
+    
+    return {
+        "response": final_ai_msg,
+        "sources": sources,
+        "message_id": final_msg_id
+    }
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# '''
+# Same as /query but streams Server-Sent Events while the agent runs:
+# status (tool calls), sources (ToolMessage.artifact), token (LLM deltas),
+# then done (final message id) or error.
+# Runs the same graph/thread config, so checkpoints match /query.
+# '''
+@app.post("/query/stream")
+async def handle_query_stream(request: QueryRequest):
+    graph, config = await prepare_query_graph(request)
+
+    async def event_stream():
         final_msg_id = None
-        for msg in messages:
-            if msg.__class__.__name__ == "AIMessage" and msg.content:
-                final_ai_msg = msg.content
-                final_msg_id = msg.id
-                # print("Final AI Message: ", msg.id)
-        
-        sources = []
-        if request.kb_type == "custom":
-            for msg in messages:
-                if msg.__class__.__name__ == "ToolMessage":
-                    if hasattr(msg, "artifact") and msg.artifact:
-                        for item in msg.artifact:
-                            sources.append({
-                                "source": item["metadata"].get("source"),
-                                "content": item["page_content"],
-                                "rerank_score": item.get("rerank_score")
-                            })
-            
-            # Deduplicate and sort sources
-            unique = {}
-            for s in sources:
-                key = s["source"]
-                if key not in unique:
-                    unique[key] = s
-            
-            sources = list(unique.values())
-            sources = sorted(sources, key=lambda x: x.get("rerank_score", 0), reverse=True)
-        
-        return {
-            "response": final_ai_msg,
-            "sources": sources,
-            "message_id": final_msg_id
-        }
+        artifacts = []
+        try:
+            async for event in graph.astream_events(
+                {"messages": request.query}, config=config, version="v2"
+            ):
+                kind = event["event"]
+
+                if kind == "on_tool_start":
+                    tool_input = event["data"].get("input") or {}
+                    yield sse_event("status", {
+                        "stage": "retrieving",
+                        "tool": event["name"],
+                        "query": tool_input.get("query") if isinstance(tool_input, dict) else None,
+                    })
+
+                elif kind == "on_tool_end":
+                    artifact = getattr(event["data"].get("output"), "artifact", None)
+                    if artifact:
+                        artifacts.append(artifact)
+                    yield sse_event("status", {"stage": "generating", "tool": event["name"]})
+                    if request.kb_type == "custom" and artifact:
+                        yield sse_event("sources", {"sources": collect_sources([artifact])})
+
+                elif event.get("metadata", {}).get("langgraph_node") != "agent":
+                    # Summarizer output is internal, only the agent's reply is streamed
+                    continue
+
+                elif kind == "on_chat_model_stream":
+                    chunk = event["data"]["chunk"]
+                    if chunk.content:
+                        yield sse_event("token", {"content": chunk.content, "message_id": chunk.id})
+
+                elif kind == "on_chat_model_end":
+                    output = event["data"].get("output")
+                    if output is not None and output.content:
+                        final_msg_id = output.id
+
+            sources = collect_sources(artifacts) if request.kb_type == "custom" else []
+            yield sse_event("done", {"message_id": final_msg_id, "sources": sources})
+
+        except Exception as e:
+            print(f"Error streaming query: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # '''
 # Retrieve conversation history from Postgres checkpointer
 # Format messages by cleaning content and attaching sources
+# (cached per thread, extended incrementally), optionally paginated
 # '''
 @app.get("/conversations/{conversation_id}")
-async def get_conversation_history(conversation_id: str):
+async def get_conversation_history(conversation_id: str, limit: int = None, before: int = None):
+    """
+    Without `limit`: every message, oldest first.
+    With `limit`: newest-first page; pass the returned `next_cursor` as
+    `before` to fetch older messages.
+    """
     try:
-        config = {"configurable": {"thread_id": conversation_id}}
-        with PostgresSaver.from_conn_string(SUPABASE_DB_URI) as checkpointer:
-            state = checkpointer.get_tuple(config)
-            if not state:
-                return {"thread_id": conversation_id, "messages": []}
-
-            raw_messages = state.checkpoint.get("channel_values", {}).get("messages", [])
-            formatted_messages = []
-            current_turn_sources = []
-
-            for msg in raw_messages:
-                # --- ToolMessage: collect sources ---
-                if isinstance(msg, ToolMessage):
-                    if hasattr(msg, "artifact") and msg.artifact:
-                        for item in msg.artifact:
-                            metadata = item.get("metadata", {})
-                            current_turn_sources.append({
-                                "source": metadata.get("source", "Unknown"),
-                                "rerank_score": item.get("rerank_score", 0),
-                                "tool_message_id": getattr(msg, "id", None)
-                            })
-                    continue
-
-                # --- HumanMessage or AIMessage ---
-                if isinstance(msg, (HumanMessage, AIMessage)):
-                    content = msg.content or ""
-                    clean_text = re.split(r"Rerank Score:", content)[0].strip()
-                    clean_text = re.sub(r"Source: \{.*?\}", "", clean_text).strip()
-                    if not clean_text:
-                        continue
-
-                    sorted_sources = []
-                    if isinstance(msg, AIMessage):
-                        unique_sources = {}
-                        for s in current_turn_sources:
-                            name = s["source"]
-                            if name not in unique_sources or s["rerank_score"] > unique_sources[name]["rerank_score"]:
-                                unique_sources[name] = s
-                        sorted_sources = sorted(unique_sources.values(), key=lambda x: x["rerank_score"], reverse=True)
-                        current_turn_sources = []
-
-                    formatted_messages.append({
-                        "id": getattr(msg, "id", None),
-                        "role": "user" if isinstance(msg, HumanMessage) else "assistant",
-                        "content": clean_text,
-                        "sources": sorted_sources
-                    })
-            # print(f"Retrieved {(formatted_messages)}")
+        formatted_messages = await get_formatted_history(conversation_id)
+        if limit is None:
             return {
                 "thread_id": conversation_id,
                 "messages": formatted_messages
             }
 
+        page, next_cursor = paginate(formatted_messages, limit, before)
+        return {
+            "thread_id": conversation_id,
+            "messages": page,
+            "total": len(formatted_messages),
+            "next_cursor": next_cursor,
+        }
+
     except Exception as e:
         print(f"Error retrieving history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -190,9 +286,10 @@ async def delete_conversation_history(conversation_id: str):
     Delete all stored history for a conversation (thread) in Postgres checkpointer.
     """
     try:
-        with PostgresSaver.from_conn_string(SUPABASE_DB_URI) as checkpointer:
-            # Remove all checkpointed state for this thread
-            checkpointer.delete_thread(conversation_id)
+        checkpointer = get_checkpointer()
+        # Remove all checkpointed state for this thread
+        await checkpointer.adelete_thread(conversation_id)
+        invalidate_history(conversation_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete conversation: {str(e)}")
 
@@ -207,44 +304,48 @@ async def upload_user_document(
     file: UploadFile = File(...),
     user_id: str = Form(...)
 ):
+    temp_path = None
     try:
-        content = await file.read()
-
-        file_id = str(uuid.uuid4())
-        storage_path = f"{user_id}/{file_id}-{file.filename}"
-
-        supabase.storage.from_("user_documents").upload(
-            storage_path,
-            content,
-            {"content-type": file.content_type},
-        )
-
-        supabase.table("user_files").insert({
-            "user_id": user_id,
-            "filename": file.filename,
-            "storage_path": storage_path
-        }).execute()
-
-        temp_path = f"/tmp/{file.filename}"
-        with open(temp_path, "wb") as f:
-            f.write(content)
-
-        text = read_uploaded_file(temp_path)
-        text = clean_text(text)
-
-        doc = Document(
-            page_content=text,
-            metadata={"source": file.filename, "user_id": user_id}
+        # Spool the upload to disk in blocks instead of reading it into memory;
+        # the ingestion job owns (and removes) the file from here on
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(file.filename or "")[1], dir=UPLOAD_SPOOL_DIR)
+        with os.fdopen(fd, "wb") as f:
+            # Off the event loop: large uploads would otherwise stall every request
+            await asyncio.to_thread(shutil.copyfileobj, file.file, f, 1024 * 1024)
+
+        def on_success(result):
+            invalidate_document_lookups(user_id)
+            invalidate_scope_graphs(user_id)
+
+        job = get_job_queue().submit(
+            "ingest_upload",
+            user_id,
+            ingest_uploaded_file,
+            args=(temp_path, file.filename, file.content_type, user_id),
+            meta={"file": file.filename},
+            on_success=on_success,
         )
 
-        create_or_load_vectorstore([doc], user_id=user_id)
-
-        os.remove(temp_path)
-
-        return {"status": "success", "file": file.filename}
+        return {
+            "status": "queued",
+            "file": file.filename,
+            "job_id": job["id"],
+        }
 
     except Exception as e:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
+
+# '''
+# Status of a background ingestion job: stage, page/chunk counts, errors
+# '''
+@app.get("/ingestion_jobs/{job_id}")
+def get_ingestion_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
     
 # '''
 # Get list of user documents from Supabase
@@ -252,12 +353,12 @@ async def upload_user_document(
 @app.get("/get_user_documents/{user_id}")
 def get_user_documents(user_id: str):
     print(f"Fetching documents for user_id--------->: {user_id}")
-    res = supabase.table("user_files").select("*").eq("user_id", user_id).execute()
+    res = get_supabase().table("user_files").select("*").eq("user_id", user_id).execute()
     return {"documents": res.data}
 
 @app.get("/download_user_document/{file_id}")
 def download_user_document(file_id: str, user_id: str):
-    record = supabase.table("user_files").select("*").eq("id", file_id).execute()
+    record = get_supabase().table("user_files").select("*").eq("id", file_id).execute()
 
     if not record.data or len(record.data) == 0:
         raise HTTPException(status_code=404, detail="File not found")
@@ -267,7 +368,7 @@ def download_user_document(file_id: str, user_id: str):
     if file["user_id"] != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
-    url = supabase.storage.from_("user_documents").create_signed_url(file["storage_path"], 60)
+    url = get_supabase().storage.from_("user_documents").create_signed_url(file["storage_path"], 60)
 
     return {"download_url": url["signedUrl"]}
 
@@ -278,7 +379,7 @@ def download_user_document(file_id: str, user_id: str):
 @app.delete("/delete_user_document/{file_id}")
 def delete_user_document(file_id: str, user_id: str):
     print(f"Deleting file -----------> {file_id} for user {user_id}")
-    record = supabase.table("user_files").select("*").eq("id", file_id).execute()
+    record = get_supabase().table("user_files").select("*").eq("id", file_id).execute()
 
     if not record.data or len(record.data) == 0:
         raise HTTPException(status_code=404, detail="File not found")
@@ -289,16 +390,14 @@ def delete_user_document(file_id: str, user_id: str):
         raise HTTPException(status_code=403, detail="Unauthorized")
 
     # Remove the file from Supabase Storage
-    supabase.storage.from_("user_documents").remove([file["storage_path"]])
+    get_supabase().storage.from_("user_documents").remove([file["storage_path"]])
 
-    # Delete all related chunks in documents table
-    supabase.table("documents").delete().match({
-        "metadata->>source": file["filename"],
-        "user_id": user_id
-    }).execute()
+    # Delete all related chunks in documents table (indexed on file_id)
+    delete_file_chunks([file_id], user_id=user_id, legacy_sources=[file["filename"]])
 
     # Delete the record from user_files table
-    supabase.table("user_files").delete().eq("id", file_id).execute()
+    get_supabase().table("user_files").delete().eq("id", file_id).execute()
+    invalidate_scope_graphs(user_id)
 
     return {"status": "deleted"}
 
@@ -332,22 +431,64 @@ def delete_user_document(file_id: str, user_id: str):
 # from Supabase and vectorstore
 # '''    
 @app.delete("/admin/delete_user/{target_user_id}")
-def admin_delete_user(target_user_id: str):
-    
-    files = supabase.table("user_files").select("*").eq("user_id", target_user_id).execute().data
+async def admin_delete_user(target_user_id: str):
+    """Queue a purge of the user's chunks, files, conversations and checkpoints"""
+
+    def on_success(result):
+        # Chunk ids are only needed here; keep them out of the job record
+        chunk_ids = result.pop("chunk_ids")
+        rerank_score_cache.invalidate_chunks(chunk_ids)
+        remove_from_mirrors(target_user_id, chunk_ids)
+        invalidate_document_lookups(target_user_id)
+        invalidate_scope_graphs(target_user_id)
+        invalidate_user_graphs(target_user_id)
+        invalidate_history(*result.get("thread_ids", []))
+
+    job = get_job_queue().submit(
+        "purge_user",
+        target_user_id,
+        purge_user,
+        args=(target_user_id,),
+        on_success=on_success,
+    )
+    return {"status": "queued", "job_id": job["id"]}
 
-    if files:
-        storage_paths = [f["storage_path"] for f in files]
-        supabase.storage.from_("user_documents").remove(storage_paths)
-        for f in files:
-            supabase.table("documents").delete().match({
-                "metadata->>source": f["filename"],
-                "user_id": target_user_id
-            }).execute()
+# '''
+# Status of a background admin job (e.g. user purge)
+# '''
+@app.get("/admin/jobs/{job_id}")
+def get_admin_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
-        supabase.table("user_files").delete().eq("user_id", target_user_id).execute()
+# '''
+# Runtime counters for connection pools and caches
+# '''
+@app.get("/metrics")
+def metrics():
+    return {
+        "checkpointer_pool": get_pool_stats(),
+        "checkpoint_compaction": compaction_stats(),
+        "graph_cache": graph_cache_stats(),
+        "history_cache": history_cache_stats(),
+        "context_window": context_stats.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "reranker": rerank_client.stats(),
+        "rerank_score_cache": rerank_score_cache.stats(),
+        "lookup_cache": lookup_cache.stats(),
+        "jobs": get_job_queue().stats(),
+        "kb_mirrors": mirror_stats(),
+        "warmup_seconds": warmup_stats(),
+    }
 
-    return {"status": "deleted", "files_deleted": len(files)}
+# '''
+# Readiness probe: answers once the lifespan warm-up has finished
+# '''
+@app.get("/health")
+def health():
+    return {"status": "ok"}
 
 @app.get("/check_user_kb/{user_id}")
 async def check_user_kb(user_id: str):
@@ -374,15 +515,21 @@ def get_prompts_endpoint(user_id: str):
 
 @app.put("/edit_prompt")
 def edit_prompt_endpoint(request: EditPromptRequest):
-    return edit_prompt(request.old_name, request.new_prompt, request.user_id)
+    result = edit_prompt(request.old_name, request.new_prompt, request.user_id)
+    invalidate_user_graphs(request.user_id)
+    return result
 
 @app.delete("/delete_prompt/{user_id}/{name}")
 def delete_prompt_endpoint(user_id: str, name: str):
-    return delete_prompt(name, user_id)
+    result = delete_prompt(name, user_id)
+    invalidate_user_graphs(user_id)
+    return result
 
 @app.post("/set_active_prompt/{user_id}/{name}")
 def set_active_prompt_endpoint(user_id: str, name: str):
-    return set_active_prompt(name, user_id)
+    result = set_active_prompt(name, user_id)
+    invalidate_user_graphs(user_id)
+    return result
 
 @app.get("/get_active_prompt/{user_id}")
 def get_active_prompt_endpoint(user_id: str):
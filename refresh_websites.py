@@ -0,0 +1,46 @@
+"""
+Refresh the website portion of the default KB (WEB_URLS).
+
+Only pages that changed since the last run (per ETag / Last-Modified and
+content hash) are re-split and re-embedded, so this is cheap enough to run
+hourly from cron:
+
+    python refresh_websites.py
+    python refresh_websites.py --force          # ignore the HTTP cache
+    python refresh_websites.py --user-id <id>   # refresh another KB
+"""
+import argparse
+import asyncio
+from app.config import WEB_URLS
+from app.tools import get_admin_user_id
+from app.web_loader import WebCache, aload_from_websites
+from app.vectorstore_supabase import replace_source_documents
+
+
+def refresh_websites(urls, user_id: str, force: bool = False):
+    cache = WebCache()
+    docs, report = asyncio.run(aload_from_websites(urls, cache=cache, force=force))
+
+    stored = set(report["unchanged"])
+    for doc in docs:
+        url = doc.metadata["source"]
+        try:
+            replace_source_documents([doc], url, user_id=user_id)
+            stored.add(url)
+        except Exception as e:
+            report["errors"].append({"url": url, "error": f"{e.__class__.__name__}: {e}"})
+
+    # Only remember validators for pages whose chunks are actually stored
+    cache.commit(urls=stored)
+    for error in report["errors"]:
+        print(f"Failed: {error['url']}: {error['error']}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", help="KB to refresh (default: the admin/default KB)")
+    parser.add_argument("--force", action="store_true", help="refetch and re-check every page")
+    args = parser.parse_args()
+
+    refresh_websites(WEB_URLS, user_id=args.user_id or get_admin_user_id(), force=args.force)
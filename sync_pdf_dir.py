@@ -0,0 +1,26 @@
+"""
+Incrementally sync PDF_DIR into the default KB.
+
+Only new or modified PDFs are parsed and embedded; chunks of removed PDFs
+are deleted. Fingerprints live in a manifest under INGEST_STATE_DIR.
+
+    python sync_pdf_dir.py --dry-run     # print the diff only
+    python sync_pdf_dir.py
+    python sync_pdf_dir.py --dir ./data --user-id <id>
+"""
+import argparse
+from app.config import PDF_DIR
+from app.tools import get_admin_user_id
+from app.pdf_sync import sync_pdf_directory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=PDF_DIR, help="directory of PDFs (default: PDF_DIR)")
+    parser.add_argument("--user-id", help="KB to sync into (default: the admin/default KB)")
+    parser.add_argument("--dry-run", action="store_true", help="print new/modified/removed files and exit")
+    args = parser.parse_args()
+
+    report = sync_pdf_directory(args.dir, user_id=args.user_id or get_admin_user_id(), dry_run=args.dry_run)
+    for error in report["errors"]:
+        print(f"Failed: {error['file']}: {error['error']}")
@@ -0,0 +1,154 @@
+"""
+History policy of app.context_window: turn-aware trimming, tool-output
+stubbing and where the rolling summary cuts.
+"""
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+import app.context_window as cw
+
+
+def turn(i, tool_calls=1, size=200):
+    """One user turn: question, tool call(s), tool results, answer"""
+    calls = [{"name": "retrieve", "args": {"query": f"q{i}.{c}"}, "id": f"call{i}.{c}"} for c in range(tool_calls)]
+    messages = [HumanMessage(f"question {i}", id=f"h{i}")]
+    if calls:
+        messages.append(AIMessage("", tool_calls=calls, id=f"ai{i}"))
+        for c, call in enumerate(calls):
+            messages.append(ToolMessage(
+                "chunk text " * size,
+                tool_call_id=call["id"],
+                artifact=[{"metadata": {"source": f"doc{i}.pdf"}}],
+                id=f"t{i}.{c}",
+            ))
+    messages.append(AIMessage(f"answer {i}", id=f"a{i}"))
+    return messages
+
+
+def conversation(turns, **kwargs):
+    return [m for i in range(turns) for m in turn(i, **kwargs)]
+
+
+def assert_tool_calls_complete(messages):
+    """Every ToolMessage kept has its AI tool call, and every kept call has its results"""
+    call_ids = {call["id"] for m in messages if isinstance(m, AIMessage) for call in m.tool_calls}
+    result_ids = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    assert call_ids == result_ids
+
+
+def test_turn_starts_are_human_messages():
+    messages = conversation(3, tool_calls=2)
+
+    starts = cw.turn_starts(messages)
+
+    assert starts == [0, 5, 10]
+    assert all(isinstance(messages[i], HumanMessage) for i in starts)
+
+
+def test_under_budget_keeps_everything():
+    messages = conversation(3)
+
+    kept, tokens, dropped = cw.trim_to_budget(messages, budget=cw.count_tokens(messages))
+
+    assert kept == messages
+    assert tokens == cw.count_tokens(messages)
+    assert dropped == 0
+
+
+@pytest.mark.parametrize("turns_that_fit", [1, 2, 3])
+def test_trim_drops_whole_turns_oldest_first(turns_that_fit):
+    messages = conversation(5, tool_calls=2)
+    recent = conversation(5, tool_calls=2)[-5 * turns_that_fit:]
+    budget = cw.count_tokens(recent) + 1
+
+    kept, tokens, dropped = cw.trim_to_budget(messages, budget=budget)
+
+    assert [m.id for m in kept] == [m.id for m in recent]
+    assert isinstance(kept[0], HumanMessage)
+    assert tokens == cw.count_tokens(kept) <= budget
+    assert dropped == len(messages) - len(kept)
+    assert_tool_calls_complete(kept)
+
+
+def test_trim_never_splits_a_tool_call_from_its_results():
+    messages = conversation(4, tool_calls=3)
+
+    # Every budget between "nothing fits" and "everything fits"
+    for budget in range(0, cw.count_tokens(messages) + 1, 50):
+        kept, _, _ = cw.trim_to_budget(messages, budget=budget)
+        assert isinstance(kept[0], HumanMessage)
+        assert_tool_calls_complete(kept)
+
+
+def test_latest_turn_is_kept_when_over_budget():
+    messages = conversation(3, size=2000)
+
+    kept, tokens, dropped = cw.trim_to_budget(messages, budget=10)
+
+    assert [m.id for m in kept] == [m.id for m in turn(2)]
+    assert tokens == cw.count_tokens(kept) > 10
+    assert dropped == len(messages) - len(kept)
+
+
+def test_stub_old_tool_messages_keeps_recent_turns_in_full():
+    messages = conversation(3)
+
+    out, stubbed = cw.stub_old_tool_messages(messages, full_tool_turns=1)
+
+    assert stubbed == 2
+    assert [m.id for m in out] == [m.id for m in messages]
+    tool_messages = [m for m in out if isinstance(m, ToolMessage)]
+    assert tool_messages[0].content == "[Earlier retrieval result omitted: 1 chunks from doc0.pdf]"
+    assert tool_messages[0].tool_call_id == "call0.0"
+    assert tool_messages[-1].content == messages[-2].content
+    # The checkpointed messages are not modified
+    assert messages[2].content.startswith("chunk text")
+
+
+def test_stub_old_tool_messages_zero_stubs_everything():
+    messages = conversation(2)
+
+    out, stubbed = cw.stub_old_tool_messages(messages, full_tool_turns=0)
+
+    assert stubbed == 2
+    assert all(m.content.startswith("[Earlier") for m in out if isinstance(m, ToolMessage))
+
+
+@pytest.fixture
+def summary_policy(monkeypatch):
+    monkeypatch.setattr(cw, "CONTEXT_SUMMARY_TRIGGER_TOKENS", 20)
+    monkeypatch.setattr(cw, "CONTEXT_KEEP_RECENT_TURNS", 2)
+
+
+def test_summary_cut_falls_on_a_turn_start(summary_policy):
+    messages = conversation(5, tool_calls=2)
+
+    cut = cw.summary_cut(messages)
+
+    assert isinstance(messages[cut], HumanMessage)
+    assert cut == cw.turn_starts(messages)[-2]
+    assert_tool_calls_complete(messages[:cut])
+    assert_tool_calls_complete(messages[cut:])
+
+
+def test_summary_cut_starts_after_already_summarized_turns(summary_policy):
+    messages = conversation(6)
+    summarized = cw.summary_cut(messages[:16])
+
+    cut = cw.summary_cut(messages, summarized_count=summarized)
+
+    assert summarized == cw.turn_starts(messages)[2]
+    assert cut == cw.turn_starts(messages)[-2]
+    assert isinstance(messages[cut], HumanMessage)
+
+
+def test_no_summary_with_few_turns_or_below_trigger(summary_policy, monkeypatch):
+    messages = conversation(2)
+    assert cw.summary_cut(messages) is None
+
+    # Tool output is stubbed before counting, so large results do not trigger it
+    monkeypatch.setattr(cw, "CONTEXT_SUMMARY_TRIGGER_TOKENS", 1000)
+    assert cw.summary_cut(conversation(5, size=5000)) is None
+
+    monkeypatch.setattr(cw, "CONTEXT_SUMMARY_TRIGGER_TOKENS", 0)
+    assert cw.summary_cut(conversation(10)) is None
@@ -0,0 +1,111 @@
+"""
+BM25 index and reciprocal rank fusion in app.lexical.
+"""
+import pytest
+
+from app.lexical import BM25Index, rank_by_bm25, reciprocal_rank_fusion, tokenize
+
+DOCS = {
+    "acme": "Acme Corp renewed the support contract for the Falcon router",
+    "falcon": "Falcon router firmware 2.1 release notes and upgrade steps",
+    "globex": "Globex onboarding checklist: accounts, VPN and router setup",
+    "initech": "Initech invoice dispute about the Falcon router warranty",
+    "empty": "the and of",
+}
+
+QUERIES = ["falcon router", "acme support contract", "globex vpn", "warranty invoice", "unknown term"]
+
+
+def build(docs):
+    index = BM25Index()
+    for key, text in docs.items():
+        index.add(key, text)
+    return index
+
+
+def by_key(results):
+    return {key: score for key, score in results}
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("What is the Falcon-2.1 router?") == ["falcon", "2", "1", "router"]
+
+
+def test_search_ranks_matching_documents_first():
+    index = build(DOCS)
+
+    results = index.search("falcon firmware", 3)
+
+    assert results[0][0] == "falcon"
+    assert {key for key, _ in results} <= {"acme", "falcon", "initech"}
+    assert index.search("unknown term", 3) == []
+    assert index.search("the and", 3) == []
+
+
+def test_incremental_add_and_remove_match_fresh_build():
+    index = build(DOCS)
+    index.add("extra", "Falcon router recall notice")
+    index.remove("globex")
+    index.remove("missing")
+    # Re-adding a key replaces its text
+    index.add("acme", "Acme Corp cancelled the Falcon router order")
+
+    final = {k: v for k, v in DOCS.items() if k != "globex"}
+    final["extra"] = "Falcon router recall notice"
+    final["acme"] = "Acme Corp cancelled the Falcon router order"
+    fresh = build(final)
+
+    assert len(index) == len(fresh)
+    assert index._postings == fresh._postings
+    assert index._total_length == fresh._total_length
+    for query in QUERIES + ["globex", "cancelled order", "renewed support"]:
+        assert by_key(index.search(query, 10)) == pytest.approx(by_key(fresh.search(query, 10)))
+
+
+def test_removing_every_document_empties_the_index():
+    index = build(DOCS)
+    for key in DOCS:
+        index.remove(key)
+
+    assert len(index) == 0
+    assert index._postings == {}
+    assert index._total_length == 0
+    assert index.search("falcon", 3) == []
+
+
+def test_rank_by_bm25_keeps_rows_and_adds_scores():
+    rows = [{"id": key, "content": text} for key, text in DOCS.items()]
+
+    ranked = rank_by_bm25("falcon warranty", rows, 2)
+
+    assert ranked[0]["id"] == "initech"
+    assert ranked[1]["id"] in {"acme", "falcon"}
+    assert ranked[0]["content"] == DOCS["initech"]
+    assert ranked[0]["bm25"] > ranked[1]["bm25"] > 0
+
+
+def test_rrf_rewards_agreement_between_lists():
+    dense = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    lexical = [{"id": "c"}, {"id": "b"}, {"id": "d"}]
+
+    fused = reciprocal_rank_fusion([dense, lexical], key_fn=lambda r: r["id"], k=60)
+
+    # b: 1/62 + 1/62, c: 1/63 + 1/61, a: 1/61, d: 1/63
+    assert [r["id"] for r in fused] == ["c", "b", "a", "d"]
+    assert fused[1]["rrf_score"] == pytest.approx(2 / 62)
+    assert fused[2]["rrf_score"] == pytest.approx(1 / 61)
+
+
+def test_rrf_ties_keep_first_seen_order_and_first_item():
+    dense = [{"id": "a", "from": "dense"}, {"id": "b", "from": "dense"}]
+    lexical = [{"id": "b", "from": "lexical"}, {"id": "a", "from": "lexical"}]
+
+    fused = reciprocal_rank_fusion([dense, lexical], key_fn=lambda r: r["id"])
+
+    assert [r["id"] for r in fused] == ["a", "b"]
+    assert fused[0]["rrf_score"] == fused[1]["rrf_score"]
+    assert all(r["from"] == "dense" for r in fused)
+
+
+def test_rrf_of_no_results_is_empty():
+    assert reciprocal_rank_fusion([[], []], key_fn=lambda r: r["id"]) == []
@@ -0,0 +1,164 @@
+"""
+Conditional-GET behaviour of app.web_loader against a local HTTP server.
+"""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.web_loader import WebCache, aload_from_websites
+
+
+class Site:
+    """Pages served by the stand-in: path -> {"body", "etag", "status"}"""
+
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+
+    def set(self, path, body, etag=None, status=200):
+        self.pages[path] = {"body": body, "etag": etag, "status": status}
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            site.requests.append((self.path, self.headers.get("If-None-Match")))
+            page = site.pages.get(self.path)
+            if page is None:
+                self.send_error(404)
+                return
+            if page["etag"] and self.headers.get("If-None-Match") == page["etag"]:
+                self.send_response(304)
+                self.end_headers()
+                return
+            if page["status"] != 200:
+                self.send_error(page["status"])
+                return
+            body = page["body"].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if page["etag"]:
+                self.send_header("ETag", page["etag"])
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def site():
+    site = Site()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.base = f"http://127.0.0.1:{server.server_port}"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "web_cache.json")
+
+
+def page(title, text):
+    return f"<html lang='en'><head><title>{title}</title></head><body>{text}</body></html>"
+
+
+def load(urls, cache_path):
+    cache = WebCache(cache_path)
+    docs, report = asyncio.run(aload_from_websites(urls, cache=cache))
+    return cache, docs, report
+
+
+def test_first_fetch_returns_every_page(site, cache_path):
+    site.set("/a", page("A", "alpha"), etag='"a1"')
+    url = site.base + "/a"
+
+    cache, docs, report = load([url], cache_path)
+    cache.commit()
+
+    assert report["changed"] == [url]
+    assert docs[0].metadata["source"] == url
+    assert docs[0].metadata["title"] == "A"
+    assert "alpha" in docs[0].page_content
+    with open(cache_path) as f:
+        assert json.load(f)[url]["etag"] == '"a1"'
+
+
+def test_etag_match_is_not_modified(site, cache_path):
+    site.set("/a", page("A", "alpha"), etag='"a1"')
+    url = site.base + "/a"
+    load([url], cache_path)[0].commit()
+
+    _, docs, report = load([url], cache_path)
+
+    assert report["not_modified"] == [url]
+    assert docs == []
+    assert site.requests[-1] == ("/a", '"a1"')
+
+
+def test_same_content_without_validators_is_unchanged(site, cache_path):
+    site.set("/b", page("B", "beta"))
+    url = site.base + "/b"
+    load([url], cache_path)[0].commit()
+
+    _, docs, report = load([url], cache_path)
+
+    assert report["unchanged"] == [url]
+    assert docs == []
+
+
+def test_changed_content_is_returned(site, cache_path):
+    site.set("/a", page("A", "alpha"), etag='"a1"')
+    url = site.base + "/a"
+    load([url], cache_path)[0].commit()
+
+    site.set("/a", page("A", "alpha v2"), etag='"a2"')
+    cache, docs, report = load([url], cache_path)
+
+    assert report["changed"] == [url]
+    assert "alpha v2" in docs[0].page_content
+    assert cache.staged[url]["etag"] == '"a2"'
+
+
+def test_force_ignores_validators(site, cache_path):
+    site.set("/a", page("A", "alpha"), etag='"a1"')
+    url = site.base + "/a"
+    load([url], cache_path)[0].commit()
+
+    docs, report = asyncio.run(aload_from_websites([url], cache=WebCache(cache_path), force=True))
+
+    assert report["changed"] == [url]
+    assert site.requests[-1] == ("/a", None)
+
+
+def test_commit_after_partial_failure_keeps_only_stored_pages(site, cache_path):
+    site.set("/ok", page("OK", "stored"), etag='"ok1"')
+    site.set("/lost", page("Lost", "embedding failed"), etag='"lost1"')
+    site.set("/down", page("Down", "server error"), status=500)
+    ok, lost, down = site.base + "/ok", site.base + "/lost", site.base + "/down"
+
+    cache, docs, report = load([ok, lost, down], cache_path)
+    assert sorted(report["changed"]) == sorted([ok, lost])
+    assert [e["url"] for e in report["errors"]] == [down]
+
+    # Only /ok made it into the KB (e.g. ingesting /lost raised)
+    cache.commit(urls={ok})
+    with open(cache_path) as f:
+        assert set(json.load(f)) == {ok}
+
+    site.set("/down", page("Down", "back up"))
+    _, docs, report = load([ok, lost, down], cache_path)
+
+    assert report["not_modified"] == [ok]
+    assert sorted(report["changed"]) == sorted([lost, down])
+    assert sorted(d.metadata["source"] for d in docs) == sorted([lost, down])